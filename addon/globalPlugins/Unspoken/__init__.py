@@ -2,21 +2,48 @@
 # By Bryan Smart (bryansmart@bryansmart.com) and Austin Hicks (camlorn38@gmail.com)
 # Updated to use Synthizer by Mason Armstrong (mason@masonasons.me)
 
+import array
 import atexit
 import os
 import os.path
 import sys
 import time
+_import_started = time.perf_counter()
+import threading
 import globalPluginHandler
 import NVDAObjects
+from NVDAObjects.IAccessible import getNVDAObjectFromEvent
 import config
 import speech
 import controlTypes
 from speech.sayAll import SayAllHandler
 from logHandler import log
 from . import sound
+from . import playback
+from . import geometry
+from . import soundpack
+from . import metrics
+from . import settings
+from . import graph
+from . import scan
+from . import objcache
+from . import hittest
+from . import trace
+from . import variants
+from . import browse
+from . import values
+from .geometry import clamp
 import gui
 import api
+import inputCore
+import queueHandler
+import synthDriverHandler
+import ui
+import winUser
+import globalVars
+import review
+import virtualBuffers
+from scriptHandler import script
 import textInfos
 import wx
 
@@ -49,13 +76,8 @@ def load_synthizer_for_python_version():
 	log.debug(f"Loading Synthizer for Python {python_version}: {synthizer_file}")
 	return synthizer_file
 
-# Carica la versione corretta di Synthizer
-try:
-	load_synthizer_for_python_version()
-	from . import synthizer
-except ImportError as e:
-	log.error(f"Failed to load Synthizer: {e}")
-	raise
+# Time spent importing the add-on, reported with the other startup phases. Synthizer itself is only loaded with the engine, and only by the backend that uses it.
+_import_time = time.perf_counter()-_import_started
 
 UNSPOKEN_ROOT_PATH = os.path.abspath(os.path.dirname(__file__))
 
@@ -108,11 +130,17 @@ controlTypes.ROLE_CHECKMENUITEM : "checkbox.wav",
 controlTypes.ROLE_SPLITBUTTON : "splitbutton.wav",
 }
 
-sounds = dict() # For holding instances in RAM.
+# Navigator fallback poll intervals, in ms.
+NAVIGATION_POLL_MIN = 100
+NAVIGATION_POLL_MAX = 1600
 
-#taken from Stackoverflow. Don't ask.
-def clamp(my_value, min_value, max_value):
-	return max(min(my_value, max_value), min_value)
+# Scripts that change the synth volume from the synth settings ring.
+VOLUME_SCRIPTS = frozenset(("script_increaseSynthSetting", "script_decreaseSynthSetting"))
+
+sounds = dict() # For holding instances in RAM. Roles sharing a file share one instance.
+
+def _percent(part, whole):
+	return part*100.0/whole if whole else 0.0
 
 class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 
@@ -120,175 +148,773 @@ class GlobalPlugin(globalPluginHandler.GlobalPlugin):
 		super(GlobalPlugin, self).__init__(*args, **kwargs)
 		from . import addonGui
 		gui.settingsDialogs.NVDASettingsDialog.categoryClasses.append(addonGui.SettingsPanel)
-		config.conf.spec["unspoken"]={
-			"sayAll" : "boolean(default=False)",
-			"speakRoles" : "boolean(default=False)",
-			"noSounds" : "boolean(default=False)",
-			"HRTF" : "boolean(default=True)",
-			"volumeAdjust" : "boolean(default=True)",
-			"Reverb" : "boolean(default=True)",
-			"ReverbLevel" : "float(default=1.0)",
-			"ReverbTime" : "float(default=0.2)",
-		}
-		log.debug("Initializing Synthizer", exc_info=True)
-		sound.initialize_synthizer()
-		log.debug("Creating Synthizer context", exc_info=True)
-		synthizer = sound.get_synthizer()
-		sound.reverb.filter_input.value=synthizer.BiquadConfig.design_identity()
-		sound.reverb.gain.value=config.conf['unspoken']['ReverbLevel']
-		sound.reverb.mean_free_path.value=0.01
-		sound.reverb.t60.value=config.conf['unspoken']['ReverbTime']
-		sound.reverb.late_reflections_delay.value=0
-#We don't want it changing the volume of sounds that are far away from the listening point (The center of the screen).
-		log.debug("Setting Synthizer context distance model to NONE", exc_info=True)
-		sound.context.default_panner_strategy.value=synthizer.PannerStrategy.STEREO if not config.conf['unspoken']['HRTF'] else synthizer.PannerStrategy.HRTF
-		sound.context.default_distance_model.value = synthizer.DistanceModel.NONE
-		self.make_sound_objects()
+		settings.initialize()
+		settings.changed.register(self._onSettingsChanged)
+		self._voices = sound.voice_allocator(settings.current.voices)
+		# Guards engine setup, which happens either at startup or on demand.
+		self._audio_lock = threading.RLock()
+		self._audio_ready = False
+		# Set if the engine could not be started, so it isn't tried again on every event.
+		self._audio_failed = False
+		self._pack = None
+		self._graph = graph.graph_manager(sounds, self._load_sound)
+		# Pre-rendered state variants of the role sounds; replaced whenever the graph configuration is worked out.
+		self._variants = variants.variant_table({})
+		# Rendered state variant buffers by sound name, kept referenced so playing one never has to render it.
+		self._variant_buffers = {}
+		# Settings changes are applied to the graph off the main thread; a newer change replaces one not applied yet.
+		self._reconfigure = playback.playback_worker(self._onReconfigure, max_pending=1, name="UnspokenGraph")
+		# Decoding and building the audio graph happen off NVDA's startup path.
+		self._startup_thread = threading.Thread(target=self._initialize_audio, name="UnspokenStartup", daemon=True)
+		self._startup_thread.start()
 		# Hook to keep NVDA from announcing roles.
 		self._NVDA_getSpeechTextForProperties = speech.speech.getPropertiesSpeech
 		speech.speech.getPropertiesSpeech = self._hook_getSpeechTextForProperties
 		
 		self._previous_mouse_object = None
-		self._last_played_object = None
-		self._last_played_time = 0
+		# Control rectangles of recently explored windows, so mouse moves resolve without asking the application.
+		self._hit_tester = hittest.hit_tester()
+		self._previous_hit = None
+		self._pointer_hit = None
+		self._pointer_voice = None
+		# Drops repeats of the same control across sources, and rate limits each source.
+		self._event_filter = playback.event_filter()
+		# The settings snapshot the filter's rates come from; a newer one is applied by the playback thread before its next event.
+		self._rates_snapshot = settings.current
+		self._apply_rates(settings.current)
 		self._last_navigator_object = None
+		self._scan = None
+		# Event trace being recorded, if any; see trace.py.
+		self._trace = None
+		# Roles and locations of recently seen controls, and a worker that fills it with the neighbours of the focus.
+		self._object_cache = objcache.object_cache()
+		self._prefetch = playback.playback_worker(self._onPrefetch, max_pending=1, name="UnspokenPrefetch")
+		# Builds hit-test and browse mode indexes. Each kind has its own slot, so a request of one kind never pushes out the other's.
+		self._indexer = playback.playback_worker(self._onIndex, max_pending=2, name="UnspokenIndex")
+		# Control fields of browse mode documents, so caret moves are resolved without asking the virtual buffer.
+		self._browse = browse.document_indexes(sound_files)
+		self._caret_field = None
+		# Sliders, dials, spin buttons and progress bars play their values on one looping voice.
+		self._value_ranges = values.value_ranges()
+		self._value_voice = values.value_voice(self._load_value_voice)
+		# All sounds are played from one worker thread, fed with the latest event from each source.
+		self._playback = playback.playback_worker(self._onPlaybackEvent)
+		# Per-stage latency timings, reported with NVDA+control+shift+u.
+		metrics.enabled = settings.current.metrics
 		
-		# Timer leggero per controllare la navigazione con frecce
+		# Navigator moves are caught where NVDA sets the navigator object.
+		self._NVDA_setNavigatorObject = api.setNavigatorObject
+		api.setNavigatorObject = self._hook_setNavigatorObject
+		# Browse mode caret moves all end up here.
+		self._NVDA_handleCaretMove = review.handleCaretMove
+		review.handleCaretMove = self._hook_handleCaretMove
+		# Fallback poll for code that moves the navigator some other way. It starts fast after user input and backs off until it stops, so an idle NVDA gets no wakeups.
+		self._navigation_interval = NAVIGATION_POLL_MIN
 		self._navigation_timer = wx.Timer()
 		self._navigation_timer.Bind(wx.EVT_TIMER, self._onNavigationTimer)
-		self._navigation_timer.Start(100)  # Controlla ogni 100ms
+		self._navigation_timer.StartOnce(self._navigation_interval)
+		self._navigation_polling = True
+		inputCore.decide_executeGesture.register(self._onGesture)
+		
+		# Speech volume is applied once to the context's master gain, and only read again after something that can change it.
+		self._volume_dirty = True
+		self._master_gain = None
+		synthDriverHandler.synthChanged.register(self._onVolumeMayHaveChanged)
+		config.post_configProfileSwitch.register(self._onVolumeMayHaveChanged)
+		config.post_configReset.register(self._onVolumeMayHaveChanged)
+		# Voice settings panels save through this when the user applies them.
+		self._NVDA_saveSynthSettings = synthDriverHandler.SynthDriver.saveSettings
+		plugin = self
+		def saveSettings(driver, *args, **kwargs):
+			result = plugin._NVDA_saveSynthSettings(driver, *args, **kwargs)
+			plugin._onVolumeMayHaveChanged()
+			return result
+		synthDriverHandler.SynthDriver.saveSettings = saveSettings
 		
-		#these are in degrees.
-		self._display_width = 180.0
-		self._display_height_min = -40.0
-		self._display_height_magnitude = 50.0
+		# Monitor layout, rebuilt only when the display configuration changes.
+		self._geometry = geometry.screen_geometry()
+		gui.mainFrame.Bind(wx.EVT_DISPLAY_CHANGED, self._onDisplayChanged)
+
+	def _initialize_audio(self):
+		try:
+			started = time.perf_counter()
+			self._ensure_audio()
+			engine_time = time.perf_counter()-started
+			decode_time, graph_time = self.make_sound_objects()
+			log.info("Unspoken startup: import %.1f ms, engine init %.1f ms, decode %.1f ms, graph build %.1f ms"%(_import_time*1000, engine_time*1000, decode_time*1000, graph_time*1000))
+		except:
+			log.error("Unspoken: could not initialize audio", exc_info=True)
+
+	def _ensure_audio(self):
+		with self._audio_lock:
+			if self._audio_ready:
+				return
+			if self._audio_failed:
+				raise RuntimeError("Unspoken: audio failed to start")
+			try:
+				self._start_audio()
+			except:
+				self._audio_failed = True
+				raise
+
+	def _start_audio(self):
+		"""Starts the engine and sets up the graph. Called with the audio lock held."""
+		log.debug("Initializing Synthizer", exc_info=True)
+		backend = settings.current.backend
+		if backend == "synthizer":
+			# Carica la versione corretta di Synthizer
+			load_synthizer_for_python_version()
+		sound.initialize_synthizer(backend, {"interpreter" : settings.current.hostPython} if backend == "remote" else None)
+		log.debug("Creating Synthizer context", exc_info=True)
+		synthizer = sound.get_synthizer()
+		sound.reverb.filter_input.value=synthizer.BiquadConfig.design_identity()
+		sound.reverb.mean_free_path.value=0.01
+		sound.reverb.late_reflections_delay.value=0
+#We don't want it changing the volume of sounds that are far away from the listening point (The center of the screen).
+		log.debug("Setting Synthizer context distance model to NONE", exc_info=True)
+		sound.context.default_distance_model.value = synthizer.DistanceModel.NONE
+		# Megabytes of unused decoded sounds to keep around; 0 keeps them all.
+		sound.gsbm.set_budget(settings.current.bufferBudget*1024*1024)
+		# A compiled pack next to the sounds saves decoding them; see soundpack.py for making one.
+		pack_path = os.path.join(UNSPOKEN_SOUNDS_PATH, soundpack.PACK_NAME)
+		if os.path.isfile(pack_path):
+			try:
+				self._pack = soundpack.sound_pack(pack_path)
+			except:
+				log.error("Unspoken: could not open sound pack %s"%pack_path, exc_info=True)
+		# Reverb and panner settings go in now; sounds are built by make_sound_objects or when first played.
+		self._graph.apply(self._graph_config(settings.current), build=False)
+		# Once nothing has played for a while the reverb routes fade out and the context pauses; the next sound brings them back.
+		sound.idle = sound.idle_monitor(sound.context, settings.current.idleTimeout, self._graph.suspend, self._graph.resume, graph.ROUTE_FADE_TIME)
+		self._audio_ready = True
 
 	def make_sound_objects(self):
-		"""Makes sound objects from synthizer."""
+		"""Makes sound objects from synthizer. Returns the time spent decoding and building the graph, in seconds."""
 		log.debug("Creating Synthizer sound objects", exc_info=True)
-		for key, value in sound_files.items():
-			path = os.path.join(UNSPOKEN_SOUNDS_PATH, value)
-			sound_object = sound.sound3d("3d",sound.context)
-			log.debug("Loading "+path, exc_info=True)
-			sound_object.load(path)
-			if config.conf["unspoken"]["Reverb"]==True: sound.context.config_route(sound_object.source, sound.reverb)
-			sounds[key] = sound_object
+		# Decode every distinct file first; the buffers stay referenced until the graph is built so the cache keeps them.
+		started = time.perf_counter()
+		preloaded = []
+		for name in set(self._sound_name(role) for role in sound_files):
+			log.debug("Loading "+name, exc_info=True)
+			if self._pack is not None and name in self._pack:
+				preloaded.append(sound.gsbm.pack_buffer(self._pack, name))
+			else:
+				preloaded.append(sound.gsbm.buffer(os.path.join(UNSPOKEN_SOUNDS_PATH, name)))
+		decode_time = time.perf_counter()-started
+		started = time.perf_counter()
+		self._graph.apply(self._graph_config(settings.current))
+		self._render_variants()
+		for buffer in preloaded:
+			sound.gsbm.release(buffer)
+		return decode_time, time.perf_counter()-started
+
+	def _sound_name(self, role):
+		"""The sound for role: the pack's role index wins over sound_files."""
+		if self._pack is not None:
+			name = self._pack.role_sound(getattr(role, 'name', None))
+			if name:
+				return name
+		return sound_files[role]
+
+	def _graph_config(self, snapshot):
+		roles = {role: self._sound_name(role) for role in sound_files}
+		self._variants = variants.variant_table(roles if snapshot.stateSounds else {})
+		return graph.graph_config(
+			roles=roles,
+			variants=self._variants.names,
+			reverb=snapshot.Reverb,
+			reverb_level=snapshot.ReverbLevel,
+			reverb_time=snapshot.ReverbTime,
+			hrtf=snapshot.HRTF,
+		)
+
+	def _load_sound(self, sound_object, name):
+		if name in self._variants.specs:
+			sound_object.load(name, buffer=self._variant_buffer(name))
+		elif self._pack is not None and name in self._pack:
+			sound_object.load(name, pack=self._pack)
+		else:
+			sound_object.load(os.path.join(UNSPOKEN_SOUNDS_PATH, name))
+
+	def _variant_buffer(self, name):
+		"""Takes a reference to the buffer of variant name, rendering it from the plain sound if that hasn't been done yet."""
+		base, variant = self._variants.specs[name]
+		pack = self._pack if self._pack is not None and base in self._pack else None
+		origin = pack.hash(base) if pack is not None else os.path.join(UNSPOKEN_SOUNDS_PATH, base)
+		return sound.gsbm.rendered_buffer("%s|%s"%(origin, name), lambda: self._render_variant(pack, base, variant))
+
+	def _render_variants(self):
+		"""Renders every variant in the table up front, on the startup or reconfigure thread, so a variant played later is only a cache lookup."""
+		started = time.perf_counter()
+		buffers = {}
+		for name in self._variants.specs:
+			try:
+				buffers[name] = self._variant_buffer(name)
+			except:
+				log.debugWarning("Unspoken: could not render %s"%name, exc_info=True)
+		old, self._variant_buffers = self._variant_buffers, buffers
+		for buffer in old.values():
+			sound.gsbm.release(buffer)
+		log.debug("Unspoken: rendered %d state variants in %.1f ms"%(len(buffers), (time.perf_counter()-started)*1000))
+
+	def _render_variant(self, pack, base, variant):
+		if pack is not None:
+			channels = pack.channels(base)
+			view = pack.samples(base)
+			try:
+				samples = array.array('f', view.tobytes())
+			finally:
+				view.release()
+			rate = pack.sample_rate
+		else:
+			channels, samples = soundpack.load_source(os.path.join(UNSPOKEN_SOUNDS_PATH, base))
+			rate = soundpack.SAMPLE_RATE
+		return rate, channels, variants.render(channels, samples, variant, rate)
+
+	def _load_value_voice(self):
+		self._ensure_audio()
+		sound_object = sound.sound3d("3d", sound.context)
+		self._load_sound(sound_object, self._sound_name(controlTypes.ROLE_SLIDER))
+		return sound_object
+
+	def _load_role(self, role):
+		"""Returns the sound for role, creating it if needed. Safe to call from any thread."""
+		self._ensure_audio()
+		return self._graph.voice(role)
+
+	def _onReconfigure(self, key, snapshot):
+		started = time.perf_counter()
+		self._graph.apply(self._graph_config(snapshot))
+		self._render_variants()
+		# Rebuilt on the next value, with the new panner and sound.
+		self._value_voice.reset()
+		log.debug("Unspoken: audio graph updated in %.1f ms"%((time.perf_counter()-started)*1000))
 
 	def shouldNukeRoleSpeech(self):
-		if config.conf["unspoken"]["sayAll"] and SayAllHandler.isRunning():
+		current = settings.current
+		if current.speakRoles:
 			return False
-		if config.conf["unspoken"]["speakRoles"]:
+		if self.isSayAllQuiet():
 			return False
 		return True
 
+	def isSayAllQuiet(self):
+		"""Whether say all is running and sounds are turned off for it."""
+		return settings.current.sayAll and SayAllHandler.isRunning()
+
 	def _hook_getSpeechTextForProperties(self, reason=NVDAObjects.controlTypes.OutputReason.QUERY, *args, **kwargs):
 		role = kwargs.get('role', None)
 		if role:
-			if (role in sounds and self.shouldNukeRoleSpeech()):
+			# Roles are only left out once their sounds can actually play.
+			if (self._audio_ready and role in sound_files and self.shouldNukeRoleSpeech()):
 				#NVDA will not announce roles if we put it in as _role.
 				kwargs['_role'] = kwargs['role']
 				del kwargs['role']
 		return self._NVDA_getSpeechTextForProperties(reason, *args, **kwargs)
 
+	def _hook_setNavigatorObject(self, obj, *args, **kwargs):
+		result = self._NVDA_setNavigatorObject(obj, *args, **kwargs)
+		try:
+			# Focus changes move the navigator too; event_gainFocus already plays those.
+			isFocus = kwargs.get('isFocus', args[0] if args else False)
+			if result is not False and obj and not isFocus:
+				self._playback.submit("navigator", obj)
+				if self._trace is not None:
+					self._trace.record("navigator", obj)
+			self._last_navigator_object = obj
+		except:
+			log.debugWarning("Unspoken: error handling navigator change", exc_info=True)
+		return result
+
+	def _hook_handleCaretMove(self, pos, *args, **kwargs):
+		result = self._NVDA_handleCaretMove(pos, *args, **kwargs)
+		try:
+			document = getattr(pos, 'obj', None)
+			if settings.current.browseMode and isinstance(document, virtualBuffers.VirtualBuffer) and not document.passThrough:
+				offset = getattr(pos, '_startOffset', None)
+				if offset is not None:
+					self._playback.submit("caret", document, offset, pos)
+		except:
+			log.debugWarning("Unspoken: error handling caret move", exc_info=True)
+		return result
+
+	def _onGesture(self, gesture=None, **kwargs):
+		# Runs on the input thread, before the gesture's script.
+		script = getattr(gesture, 'script', None)
+		if script is not None and script.__name__ in VOLUME_SCRIPTS:
+			self._volume_dirty = True
+			# The script is queued after this returns, so the volume is marked again from a call queued behind it, once the change has been made.
+			queueHandler.queueFunction(queueHandler.eventQueue, queueHandler.queueFunction, queueHandler.eventQueue, self._onVolumeMayHaveChanged)
+		# User input: poll quickly again for a while.
+		if self._navigation_interval != NAVIGATION_POLL_MIN or not self._navigation_polling:
+			self._navigation_interval = NAVIGATION_POLL_MIN
+			self._navigation_polling = True
+			wx.CallAfter(self._navigation_timer.StartOnce, self._navigation_interval)
+		return True
+
 	def _onNavigationTimer(self, event):
 		"""Timer per controllare cambiamenti del navigator object senza bloccare"""
 		try:
 			current_nav = api.getNavigatorObject()
 			if current_nav and current_nav != self._last_navigator_object:
 				self._last_navigator_object = current_nav
-				# Riproduci suono in thread separato per non bloccare
-				import threading
-				def play_async():
-					try:
-						self.play_object(current_nav)
-					except:
-						pass
-				threading.Thread(target=play_async, daemon=True).start()
+				self._playback.submit("navigator", current_nav)
+				if self._trace is not None:
+					self._trace.record("navigator", current_nav)
+				self._navigation_interval = NAVIGATION_POLL_MIN
+			else:
+				self._navigation_interval *= 2
 		except:
 			# Ignora qualsiasi errore per non interrompere il timer
 			pass
+		if self._navigation_interval <= NAVIGATION_POLL_MAX:
+			self._navigation_timer.StartOnce(self._navigation_interval)
+		else:
+			self._navigation_polling = False
+
+	def _apply_rates(self, snapshot):
+		self._event_filter.set_rate("focus", snapshot.focusRate, snapshot.rateBurst)
+		self._event_filter.set_rate("navigator", snapshot.navigatorRate, snapshot.rateBurst)
+		self._event_filter.set_rate("mouse", snapshot.mouseRate, snapshot.rateBurst)
+
+	def _onSettingsChanged(self, snapshot):
+		metrics.enabled = snapshot.metrics
+		self._volume_dirty = True
+		if hasattr(self, '_voices'):
+			self._voices.set_max_voices(snapshot.voices)
+		if self._audio_ready:
+			sound.gsbm.set_budget(snapshot.bufferBudget*1024*1024)
+			sound.idle.set_timeout(snapshot.idleTimeout)
+			self._reconfigure.submit("graph", snapshot)
+
+	def _onVolumeMayHaveChanged(self, *args, **kwargs):
+		self._volume_dirty = True
+
+	def _update_master_gain(self):
+		self._volume_dirty = False
+		gain = self._compute_volume()
+		if gain != self._master_gain:
+			self._master_gain = gain
+			sound.context.gain.value = gain
 
 	def _compute_volume(self):
-		if not config.conf["unspoken"]["volumeAdjust"]:
+		if not settings.current.volumeAdjust:
 			return 1.0
 		driver=speech.speech.getSynth()
 		volume = getattr(driver, 'volume', 100)/100.0 #nvda reports as percent.
 		volume=clamp(volume, 0.0, 1.0)
-		return volume if not config.conf['unspoken']['HRTF'] else volume+0.25
+		return volume if not settings.current.HRTF else volume+0.25
 
-	def play_object(self, obj):
-		if config.conf["unspoken"]["noSounds"]:
+	def _onPlaybackEvent(self, source, *args):
+		snapshot = settings.current
+		if snapshot is not self._rates_snapshot:
+			# The filter belongs to the playback thread, so its limits are changed there too. Compared on every event rather than queued, so a burst of events can't push a change out.
+			self._rates_snapshot = snapshot
+			self._apply_rates(snapshot)
+			if not snapshot.mouseTracking:
+				self._stop_pointer_voice()
+		if self._audio_failed:
 			return
-		curtime = time.time()
-		if curtime-self._last_played_time < 0.1 and obj is self._last_played_object:
+		if source == "pointer":
+			self.play_pointer(*args)
 			return
-		self._last_played_object = obj
-		self._last_played_time = curtime
-		role = obj.role
-		if role in sounds:
-			# Get coordinate bounds of desktop.
-			desktop = NVDAObjects.api.getDesktopObject()
-			desktop_max_x = desktop.location[2]
-			desktop_max_y = desktop.location[3]
-			# Get location of the object.
-			if obj.location != None:
-				# Object has a location. Get its center.
-				obj_x = obj.location[0] + (obj.location[2] / 2.0)
-				obj_y = obj.location[1] + (obj.location[3] / 2.0)
-			else:
-				# Objects without location are assumed in the center of the screen.
-				obj_x = desktop_max_x / 2.0
-				obj_y = desktop_max_y / 2.0
-			# Scale object position to audio display.
-			angle_x = ((obj_x-desktop_max_x/2.0)/desktop_max_x)*self._display_width
-			#angle_y is a bit more involved.
-			percent = (desktop_max_y-obj_y)/desktop_max_y
-			angle_y = self._display_height_magnitude*percent+self._display_height_min
-			#clamp these to Libaudioverse's internal ranges.
-			angle_x = clamp(angle_x, -90.0, 90.0)
-			angle_y = clamp(angle_y, -90.0, 90.0)
-			#In theory, this can be made faster if we remember which is last, but that shouldn't matter here
-			for i, j in sounds.items():
-				j.stop()
-			sounds[role].generator.playback_position.value = 0.0
-			sounds[role].source.position.value = (angle_x, angle_y, 0)
-			sounds[role].source.gain.value=self._compute_volume()
-			sounds[role].play()
+		if source == "caret":
+			self.play_caret(*args)
+			return
+		if source == "value":
+			self.play_value(args[0])
+			return
+		if source == "mouse":
+			# The pointer left the indexed controls.
+			self._stop_pointer_voice()
+		self.play_object(args[0], source)
 
+	def play_object(self, obj, source=None):
+		if settings.current.noSounds:
+			return
+		timing = metrics.enabled
+		if timing:
+			started = metrics.now()
+		# NVDA makes a new object for each event, so repeats are spotted by the control's identity rather than the instance.
+		key = objcache.object_key(obj)
+		if not self._event_filter.admit(source, key, obj):
+			return
+		# Fetched once, or taken from the cache; every access can be a cross-process call.
+		table = self._variants
+		role, location, states = self._object_cache.fetch(obj, sound_files, key, table.relevant)
+		if role in sound_files:
+			if timing:
+				metrics.record("location", metrics.now()-started, source)
+			self.play_role(role, location, source, table.lookup(role, states))
+			if timing:
+				metrics.record("total", metrics.now()-started, source, getattr(role, 'name', role))
+
+	def play_pointer(self, hit, x, y):
+		"""Plays the control found by the hit tester. With x and y (continuous mode), the sound follows the pointer: it loops from where the pointer enters the control, moves with it, and stops when the pointer leaves."""
+		if settings.current.noSounds or hit is None:
+			self._stop_pointer_voice()
+			return
+		role, location = hit
+		if role not in sound_files:
+			self._stop_pointer_voice()
+			return
+		if x is not None:
+			if hit == self._pointer_hit and self._pointer_voice is not None:
+				angle_x, angle_y = self._geometry.angles((x, y, 0, 0))
+				# Keeps the engine from being suspended while the pointer glides.
+				sound.activity(self._pointer_voice.length or 0.0)
+				self._pointer_voice.move((angle_x, angle_y, 0))
+				return
+			self._stop_pointer_voice()
+			if not self._event_filter.admit("mouse", hit):
+				return
+			self._pointer_hit = hit
+			self._start_pointer_voice(role, (x, y, 0, 0))
+			return
+		self._stop_pointer_voice()
+		if not self._event_filter.admit("mouse", hit):
+			return
+		self._pointer_hit = hit
+		self.play_role(role, location, "mouse")
+
+	def _start_pointer_voice(self, role, location):
+		angle_x, angle_y = self._geometry.angles(location)
+		sound_object = sounds.get(role) or self._load_role(role)
+		self._voices.allocate(sound_object)
+		if self._volume_dirty:
+			self._update_master_gain()
+		sound_object.move((angle_x, angle_y, 0))
+		sound_object.play_looped()
+		self._pointer_voice = sound_object
+		if metrics.enabled:
+			metrics.count("played/mouse", "played/%s"%getattr(role, 'name', role))
+
+	def _stop_pointer_voice(self):
+		"""Stops the voice looping under the pointer in continuous mode, unless something else has taken it over since."""
+		self._pointer_hit = None
+		voice, self._pointer_voice = self._pointer_voice, None
+		if voice is not None and voice.looping:
+			self._voices.release(voice)
+
+	def play_caret(self, document, offset, info):
+		"""Plays the control the browse mode caret is in, when it moves into a different one."""
+		if settings.current.noSounds:
+			return
+		# Say all moves the caret through every field it reads.
+		if self.isSayAllQuiet():
+			return
+		index = self._browse.get(document)
+		if index is None:
+			# Built in the background; moves until then play nothing.
+			self._indexer.submit("document", document)
+			return
+		if index.stale:
+			# Still used until the new one is ready; verify() below catches the fields that have moved.
+			self._indexer.submit("document", document)
+		role, states, field_id = index.lookup(offset)
+		if field_id == self._caret_field:
+			return
+		if field_id is not None and not index.verify(field_id, offset):
+			# The document changed without telling us; play nothing until it's indexed again.
+			self._caret_field = None
+			self._indexer.submit("document", document)
+			return
+		self._caret_field = field_id
+		if role is None:
+			return
+		try:
+			location = info.boundingRects[0]
+		except:
+			location = None
+		self.play_role(role, location, "caret", self._variants.lookup(role, states))
+
+	def play_value(self, obj):
+		"""Moves the value voice to obj's value, if obj is a slider, dial, spin button or progress bar. Storms of changes are coalesced by the voice, not retriggered."""
+		current = settings.current
+		if current.noSounds or not current.valueSounds:
+			return
+		key = objcache.object_key(obj)
+		role, location, states = self._object_cache.fetch(obj, values.VALUE_ROLES, key)
+		if role not in values.VALUE_ROLES:
+			return
+		fraction = self._value_ranges.fraction(key, obj.value)
+		if fraction is None:
+			return
+		if self._volume_dirty:
+			self._update_master_gain()
+		angle_x, angle_y = self._geometry.angles(values.point(location, fraction))
+		self._value_voice.update(values.pitch(fraction), (angle_x, angle_y, 0))
+		if metrics.enabled:
+			metrics.count("played/value", "played/%s"%getattr(role, 'name', role))
+
+	def play_role(self, role, location, source=None, sound_key=None):
+		"""Plays role's sound at location. sound_key picks a state variant (see variants.py) instead of the plain sound."""
+		timing = metrics.enabled
+		if timing:
+			started = metrics.now()
+		if sound_key is None:
+			sound_key = role
+		angle_x, angle_y = self._geometry.angles(location)
+		# Events can arrive before the startup thread gets to this role; load it now if so.
+		sound_object = sounds.get(sound_key) or self._load_role(sound_key)
+		# Only the voices that are actually sounding get stopped.
+		self._voices.allocate(sound_object)
+		if timing:
+			mark = metrics.now()
+			metrics.record("allocate", mark-started, source)
+		if self._volume_dirty:
+			self._update_master_gain()
+		if timing:
+			metrics.record("volume", metrics.now()-mark, source)
+			mark = metrics.now()
+		sound_object.trigger(position=(angle_x, angle_y, 0))
+		if timing:
+			metrics.record("trigger", metrics.now()-mark, source)
+			metrics.count("played/%s"%source, "played/%s"%getattr(role, 'name', role))
+
+	def _onDisplayChanged(self, event):
+		event.Skip()
+		self._geometry.refresh()
 
 	def event_gainFocus(self, obj, nextHandler):
 		# Chiama sempre nextHandler per primo per non bloccare la navigazione
 		nextHandler()
 		# Riproduci suono in modo asincrono per non bloccare
-		import threading
-		def play_async():
-			try:
-				self.play_object(obj)
-			except:
-				pass
-		threading.Thread(target=play_async, daemon=True).start()
+		self._playback.submit("focus", obj)
+		self._prefetch.submit("prefetch", obj)
+		if self._trace is not None:
+			self._trace.record("focus", obj)
+
+	def _onPrefetch(self, key, obj):
+		self._object_cache.prefetch(obj)
+
+	def _onIndex(self, key, *args):
+		if key == "document":
+			self._browse.build(*args)
+			return
+		hwnd, = args
+		if not self._hit_tester.has(hwnd):
+			# The index covers the whole top-level window, so it is built from that window's own object rather than whatever is under the pointer.
+			root = getNVDAObjectFromEvent(hwnd, winUser.OBJID_CLIENT, 0)
+			if root is not None:
+				self._hit_tester.build(hwnd, root)
+
+	def _document_changed(self, obj, structure=False):
+		"""Tells the browse mode index of obj's document that obj changed, or with structure that controls came or went."""
+		if not self._browse:
+			return
+		document = getattr(obj, 'treeInterceptor', None)
+		if isinstance(document, virtualBuffers.VirtualBuffer):
+			self._browse.changed(document, None if structure else obj)
+
+	def _invalidate_layout(self, obj):
+		hwnd = getattr(obj, 'windowHandle', None)
+		self._object_cache.invalidate_window(hwnd)
+		# Hit-test indexes are per top-level window.
+		if hwnd:
+			self._hit_tester.invalidate(winUser.getAncestor(hwnd, winUser.GA_ROOT))
+
+	def event_locationChange(self, obj, nextHandler):
+		nextHandler()
+		# Layout moved; anything cached for this window may be stale.
+		self._invalidate_layout(obj)
+
+	def event_nameChange(self, obj, nextHandler):
+		nextHandler()
+		key = objcache.object_key(obj)
+		if key is not None:
+			self._object_cache.invalidate(key)
+		self._document_changed(obj)
+
+	def event_valueChange(self, obj, nextHandler):
+		nextHandler()
+		# Only the latest value waits on the playback thread, so a slider being dragged queues one event at a time.
+		if settings.current.valueSounds:
+			self._playback.submit("value", obj)
+		self._document_changed(obj)
+
+	def event_stateChange(self, obj, nextHandler):
+		nextHandler()
+		key = objcache.object_key(obj)
+		if key is not None:
+			self._object_cache.invalidate(key)
+		self._document_changed(obj)
+
+	def event_destroy(self, obj, nextHandler):
+		nextHandler()
+		key = objcache.object_key(obj)
+		if key is not None:
+			self._object_cache.invalidate(key)
+		hwnd = getattr(obj, 'windowHandle', None)
+		if hwnd:
+			self._hit_tester.invalidate(winUser.getAncestor(hwnd, winUser.GA_ROOT))
+
+	def event_show(self, obj, nextHandler):
+		nextHandler()
+		self._invalidate_layout(obj)
+		self._document_changed(obj, structure=True)
+
+	def event_hide(self, obj, nextHandler):
+		nextHandler()
+		self._invalidate_layout(obj)
+		self._document_changed(obj, structure=True)
 
 	def event_mouseMove(self, obj, nextHandler, x, y):
 		# Chiama sempre nextHandler per primo
 		nextHandler()
-		# Gestisci mouse move in thread separato
-		if obj != self._previous_mouse_object:
-			self._previous_mouse_object = obj
-			import threading
-			def play_async():
-				try:
-					self.play_object(obj)
-				except:
-					pass
-			threading.Thread(target=play_async, daemon=True).start()
+		if self._trace is not None:
+			self._trace.record("mouse", obj, x, y)
+		# Indexes are per top-level window, the one under the pointer rather than the foreground one, so the taskbar and desktop get theirs too.
+		hwnd = getattr(obj, 'windowHandle', None)
+		root = winUser.getAncestor(hwnd, winUser.GA_ROOT) if hwnd else None
+		hit = self._hit_tester.lookup(root, x, y) if root else hittest.UNKNOWN
+		if hit is hittest.UNKNOWN:
+			# No index for this window yet, or the point is outside it: use the object NVDA found this time, and build one for the next moves.
+			if root and not self._hit_tester.has(root):
+				self._indexer.submit("index", root)
+			# Gestisci mouse move in thread separato
+			if obj != self._previous_mouse_object:
+				self._previous_mouse_object = obj
+				self._previous_hit = None
+				self._playback.submit("mouse", obj)
+			return
+		self._previous_mouse_object = None
+		if settings.current.mouseTracking:
+			self._playback.submit("pointer", hit, x, y)
+		elif hit != self._previous_hit:
+			self._previous_hit = hit
+			self._playback.submit("pointer", hit, None, None)
+
+	@script(
+		description="Plays the sound of every control in the foreground window at its position; press again to stop",
+		category="Unspoken",
+		gesture="kb:NVDA+shift+u"
+	)
+	def script_scanWindow(self, gesture):
+		if self._scan is not None:
+			self._scan.cancel()
+			self._scan = None
+			ui.message("Scan stopped")
+			return
+		if settings.current.noSounds:
+			return
+		root = api.getForegroundObject()
+		if root is None:
+			return
+		try:
+			self._ensure_audio()
+		except:
+			return
+		voices = scan.scan_voices(self._loadScanSound, self._geometry.angles, settings.current.Reverb)
+		self._scan = scan.window_scan(root, sound_files, voices, settings.current.scanInterval/1000.0, self._onScanDone)
+
+	def _loadScanSound(self, sound_object, role):
+		self._load_sound(sound_object, self._sound_name(role))
+
+	def _onScanDone(self, finished):
+		if self._scan is finished:
+			self._scan = None
+
+	@script(
+		description="Reports Unspoken latency metrics and writes them to the NVDA log",
+		category="Unspoken",
+		gesture="kb:NVDA+control+shift+u"
+	)
+	def script_reportMetrics(self, gesture):
+		if not metrics.enabled:
+			ui.message("Unspoken metrics are off")
+			return
+		lines = metrics.report()
+		stats = self._playback.stats()
+		lines.extend("playback %s: %d"%(k, v) for k, v in sorted(stats.items()))
+		lines.append("event filter: %d repeats dropped, %d rate limited"%(self._event_filter.deduplicated, self._event_filter.limited))
+		lines.append("object cache: %d hits, %d misses"%(self._object_cache.hits, self._object_cache.misses))
+		idle = sound.idle.stats() if sound.idle is not None else None
+		if idle is not None:
+			lines.append("engine %s, suspended %d times: active %.0f s at %.2f%% CPU, suspended %.0f s at %.2f%% CPU"%(
+				idle["state"], idle["suspensions"],
+				idle["active_wall"], _percent(idle["active_cpu"], idle["active_wall"]),
+				idle["suspended_wall"], _percent(idle["suspended_cpu"], idle["suspended_wall"]),
+			))
+		if sound.backend == "remote":
+			lines.append(sound._synthizer_module.status())
+		lines.append("value voice: %d updates, %d coalesced, %d engine writes"%(self._value_voice.updates, self._value_voice.coalesced, self._value_voice.writes))
+		log.info("Unspoken metrics:\n"+"\n".join(lines))
+		ui.message("Unspoken metrics written to the log, %d events queued, %d coalesced, %d dropped"%(stats['queued'], stats['coalesced'], stats['dropped']))
+
+	@script(
+		description="Turns Unspoken latency metrics on or off",
+		category="Unspoken"
+	)
+	def script_toggleMetrics(self, gesture):
+		metrics.enabled = not metrics.enabled
+		config.conf['unspoken']['metrics'] = metrics.enabled
+		settings.refresh()
+		if metrics.enabled:
+			metrics.reset()
+		ui.message("Unspoken metrics on" if metrics.enabled else "Unspoken metrics off")
+
+	@script(
+		description="Starts or stops recording Unspoken events to a trace file, for replaying with tools/replayTrace.py",
+		category="Unspoken"
+	)
+	def script_toggleTrace(self, gesture):
+		if self._trace is not None:
+			recorder, self._trace = self._trace, None
+			events = recorder.close()
+			ui.message("Unspoken trace stopped, %d events"%events)
+			return
+		folder = os.path.join(globalVars.appArgs.configPath, "unspokenTraces")
+		os.makedirs(folder, exist_ok=True)
+		path = os.path.join(folder, time.strftime("%Y%m%d-%H%M%S")+".jsonl.gz")
+		self._trace = trace.trace_recorder(path, settings.current)
+		ui.message("Unspoken trace started")
 
 	def terminate(self):
 		# Ferma il timer
 		if hasattr(self, '_navigation_timer'):
 			self._navigation_timer.Stop()
+		inputCore.decide_executeGesture.unregister(self._onGesture)
+		synthDriverHandler.synthChanged.unregister(self._onVolumeMayHaveChanged)
+		config.post_configProfileSwitch.unregister(self._onVolumeMayHaveChanged)
+		config.post_configReset.unregister(self._onVolumeMayHaveChanged)
+		synthDriverHandler.SynthDriver.saveSettings = self._NVDA_saveSynthSettings
+		gui.mainFrame.Unbind(wx.EVT_DISPLAY_CHANGED, handler=self._onDisplayChanged)
+		if api.setNavigatorObject == self._hook_setNavigatorObject:
+			api.setNavigatorObject = self._NVDA_setNavigatorObject
+		if review.handleCaretMove == self._hook_handleCaretMove:
+			review.handleCaretMove = self._NVDA_handleCaretMove
+		
+		self._playback.stop()
+		self._reconfigure.stop()
+		self._prefetch.stop()
+		self._indexer.stop()
+		if self._scan is not None:
+			self._scan.cancel()
+		if self._trace is not None:
+			self._trace.close()
+		sound.scheduler.stop()
+		self._startup_thread.join(1.0)
+		self._voices.stop_all()
+		self._value_voice.reset()
+		if sound.idle is not None:
+			sound.idle.close()
+			sound.idle = None
+		self._graph.close()
+		for buffer in self._variant_buffers.values():
+			sound.gsbm.release(buffer)
+		self._variant_buffers = {}
+		if self._pack is not None:
+			self._pack.close()
+		log.debug("Unspoken playback stats: %r"%self._playback.stats())
+		
+		settings.changed.unregister(self._onSettingsChanged)
+		settings.terminate()
 		
 		# Ripristina gli hook originali
 		speech.speech.getPropertiesSpeech = self._NVDA_getSpeechTextForProperties
 		
 		if sound._synthizer_initialized and sound._synthizer_module:
+			if sound.backend == "null":
+				log.info("Unspoken engine calls: %r"%dict(sound._synthizer_module.recorder.counts))
 			sound._synthizer_module.shutdown()
\ No newline at end of file
@@ -13,7 +13,7 @@ class SettingsPanel(gui.settingsDialogs.SettingsPanel):
 		self.speakRolesCheckBox.SetValue(config.conf["unspoken"]["speakRoles"])
 		self.HRTFCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Use &HRTF (3D Sound)"))
 		self.HRTFCheckBox.SetValue(config.conf["unspoken"]["HRTF"])
-		self.ReverbCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Use &Reverb (Requires NVDA Restart)"))
+		self.ReverbCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Use &Reverb"))
 		self.ReverbCheckBox.SetValue(config.conf["unspoken"]["Reverb"])
 		self.ReverbLevelSliderLabel = settingsSizer.addItem(wx.StaticText(self, label="Reverb Level"))
 		self.ReverbLevelSlider = settingsSizer.addItem(wx.Slider(self))
@@ -25,6 +25,14 @@ class SettingsPanel(gui.settingsDialogs.SettingsPanel):
 		self.noSoundsCheckBox.SetValue((True if config.conf["unspoken"]["noSounds"]==False else False))
 		self.volumeCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Automatically adjust sounds with speech &volume"))
 		self.volumeCheckBox.SetValue(config.conf["unspoken"]["volumeAdjust"])
+		self.mouseTrackingCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="&Move sounds with the mouse pointer"))
+		self.mouseTrackingCheckBox.SetValue(config.conf["unspoken"]["mouseTracking"])
+		self.stateSoundsCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Change sounds with control s&tates"))
+		self.stateSoundsCheckBox.SetValue(config.conf["unspoken"]["stateSounds"])
+		self.browseModeCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Play sounds for controls in &browse mode"))
+		self.browseModeCheckBox.SetValue(config.conf["unspoken"]["browseMode"])
+		self.valueSoundsCheckBox = settingsSizer.addItem(wx.CheckBox(self, label="Play slider and progress bar va&lues"))
+		self.valueSoundsCheckBox.SetValue(config.conf["unspoken"]["valueSounds"])
 
 	def postInit(self):
 		self.sayAllCheckBox.SetFocus()
@@ -35,37 +43,16 @@ class SettingsPanel(gui.settingsDialogs.SettingsPanel):
 			return
 		config.conf["unspoken"]["sayAll"] = not self.sayAllCheckBox.IsChecked()
 		config.conf["unspoken"]["speakRoles"] = self.speakRolesCheckBox.IsChecked()
-		
-		# Import solo quando necessario per evitare import circolari
-		try:
-			from . import sound
-			# Assicurati che Synthizer sia inizializzato prima di usarlo
-			sound.ensure_synthizer_initialized()
-			if sound.context:
-				synthizer = sound.get_synthizer()
-				sound.context.default_panner_strategy.value=synthizer.PannerStrategy.STEREO if not config.conf['unspoken']['HRTF'] else synthizer.PannerStrategy.HRTF
-		except ImportError:
-			pass
-		
 		config.conf["unspoken"]["HRTF"] = self.HRTFCheckBox.IsChecked()
 		config.conf["unspoken"]["Reverb"] = self.ReverbCheckBox.IsChecked()
 		config.conf["unspoken"]["ReverbLevel"] = self.ReverbLevelSlider.GetValue()/100
-		
-		try:
-			from . import sound
-			if sound.reverb:
-				sound.reverb.gain.value=config.conf["unspoken"]["ReverbLevel"]
-		except ImportError:
-			pass
-		
 		config.conf["unspoken"]["ReverbTime"] = self.ReverbTimeSlider.GetValue()/100
-		
-		try:
-			from . import sound
-			if sound.reverb:
-				sound.reverb.t60.value=config.conf["unspoken"]["ReverbTime"]
-		except ImportError:
-			pass
-		
 		config.conf["unspoken"]["noSounds"] = not self.noSoundsCheckBox.IsChecked()
 		config.conf["unspoken"]["volumeAdjust"] = self.volumeCheckBox.IsChecked()
+		config.conf["unspoken"]["mouseTracking"] = self.mouseTrackingCheckBox.IsChecked()
+		config.conf["unspoken"]["stateSounds"] = self.stateSoundsCheckBox.IsChecked()
+		config.conf["unspoken"]["browseMode"] = self.browseModeCheckBox.IsChecked()
+		config.conf["unspoken"]["valueSounds"] = self.valueSoundsCheckBox.IsChecked()
+		# The add-on picks the new settings up and updates only the parts of the audio graph that changed.
+		from . import settings
+		settings.refresh()
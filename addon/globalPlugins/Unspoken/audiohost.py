@@ -0,0 +1,185 @@
+#Audio host for Unspoken.
+#Runs the audio engine in its own process, so engine work doesn't compete with NVDA for its interpreter and a crash in the native engine doesn't take NVDA down.
+#remotesynth.py starts this file with a separate Python interpreter, sends it commands over a shared memory ring (see ring.py) and rings a doorbell on its standard input when it may be asleep. Replies to the few commands that need one go back over a second ring.
+#executor is also used inside NVDA when the host can't be run, so the add-on has one way of applying commands either way.
+#Usage: python audiohost.py COMMAND_RING REPLY_RING ADDON_DIR [ENGINE]
+#ENGINE is the engine module to load from ADDON_DIR, synthizer unless given; nullsynth runs the host without an audio device.
+
+import array
+import os
+import pickle
+import sys
+import threading
+import traceback
+
+#Values that aren't plain numbers and tuples travel tagged: objects by id, enum members and filter designs by name.
+REF = "@ref"
+ENUM = "@enum"
+BIQUAD = "@biquad"
+_TAGS = frozenset((REF, ENUM, BIQUAD))
+
+#The doorbell is waited on this long at most, in case a ring came between the reader saying it sleeps and the writer looking.
+DOORBELL_TIMEOUT = 0.1
+
+class executor(object):
+	"""Applies engine commands to a Synthizer-like module. Objects are known by the ids the add-on hands out, so it never waits to learn them."""
+
+	def __init__(self, synthizer):
+		self.synthizer = synthizer
+		self.objects = {}
+
+	def decode(self, value):
+		if isinstance(value, tuple) and value and value[0] in _TAGS:
+			if value[0] == REF:
+				return self.objects[value[1]]
+			if value[0] == ENUM:
+				return getattr(getattr(self.synthizer, value[1]), value[2])
+			return getattr(self.synthizer.BiquadConfig, value[1])(*value[2])
+		if isinstance(value, list):
+			return [self.decode(v) for v in value]
+		return value
+
+	def run(self, command):
+		"""Applies one command tuple. Returns what asks and gets are answered with, None for everything else."""
+		op = command[0]
+		if op == "set":
+			oid, prop, value = command[1:]
+			getattr(self.objects[oid], prop).value = self.decode(value)
+		elif op == "call":
+			oid, method, args, kwargs = command[1:]
+			getattr(self.objects[oid], method)(*self.decode(args), **{k : self.decode(v) for k, v in kwargs.items()})
+		elif op == "automate":
+			self.automate(*command[1:])
+		elif op == "new":
+			oid, cls, args = command[1:]
+			self.objects[oid] = getattr(self.synthizer, cls)(*self.decode(args))
+		elif op == "del":
+			obj = self.objects.pop(command[1], None)
+			if obj is not None:
+				obj.destroy()
+		elif op == "ask":
+			oid, method, args = command[1:]
+			return getattr(self.objects[oid], method)(*self.decode(args))
+		elif op == "get":
+			oid, prop = command[1:]
+			return getattr(self.objects[oid], prop).value
+		elif op == "ping":
+			return os.getpid()
+		else:
+			raise ValueError("unknown command %r"%op)
+		return None
+
+	def automate(self, context, clears, points):
+		"""Runs one automation batch: clears are (time, id, property) and points (time, id, property, value)."""
+		batch = self.synthizer.AutomationBatch(self.objects[context])
+		for t, oid, prop in clears:
+			batch.clear_property(t, getattr(self.objects[oid], prop))
+		for t, oid, prop, value in points:
+			batch.append_property(t, getattr(self.objects[oid], prop), self.decode(value))
+		batch.execute()
+		batch.destroy()
+
+	def buffer(self, oid, kind, data, meta):
+		"""Makes a buffer from encoded file data, or with kind "float" from float samples with meta (sample rate, channels). Returns (channels, frames, sample rate, bytes)."""
+		if kind == "float":
+			sample_rate, channels = meta
+			samples = array.array("f")
+			samples.frombytes(data)
+			buffer = self.synthizer.Buffer.from_float_array(sample_rate, channels, samples)
+		else:
+			buffer = self.synthizer.Buffer.from_encoded_data(bytes(data))
+		self.objects[oid] = buffer
+		channels = buffer.get_channels()
+		frames = buffer.get_length_in_samples()
+		seconds = buffer.get_length_in_seconds()
+		try:
+			size = buffer.get_size_in_bytes()
+		except AttributeError:
+			size = frames*channels*2
+		return channels, frames, frames/seconds if seconds else 44100, size
+
+	def close(self):
+		for obj in reversed(list(self.objects.values())):
+			try:
+				obj.destroy()
+			except Exception:
+				pass
+		self.objects.clear()
+
+def _read_doorbell(stream, doorbell, closed):
+	#The add-on holds the other end; when it goes away, so does the host.
+	while stream.read(1):
+		doorbell.set()
+	closed.set()
+	doorbell.set()
+
+def serve(commands, replies, run, doorbell, closed):
+	"""Runs commands from the commands ring until shutdown or the doorbell's pipe closes."""
+	while not closed.is_set():
+		data = commands.get()
+		if data is None:
+			commands.sleeping = True
+			if commands.empty():
+				doorbell.wait(DOORBELL_TIMEOUT)
+				doorbell.clear()
+			commands.sleeping = False
+			continue
+		command = pickle.loads(data)
+		if command[0] == "shutdown":
+			return
+		seq = command[1] if command[0] in ("ask", "get", "buffer", "ping") else None
+		try:
+			result = run(command)
+		except Exception:
+			if seq is None:
+				traceback.print_exc()
+				continue
+			result = ("error", traceback.format_exc(limit=4))
+		else:
+			result = ("ok", result)
+		if seq is not None:
+			while not replies.put(pickle.dumps((seq, result), 4)):
+				#The add-on reads replies as soon as it asks, so this only waits for a slow reader.
+				closed.wait(0.001)
+
+def main(argv):
+	commands_name, replies_name, addon_dir = argv[:3]
+	engine = argv[3] if len(argv) > 3 else "synthizer"
+	sys.path.insert(0, addon_dir)
+	import importlib
+	import ring
+	synthizer = importlib.import_module(engine)
+	commands = ring.spsc_ring(commands_name)
+	replies = ring.spsc_ring(replies_name)
+	doorbell = threading.Event()
+	closed = threading.Event()
+	threading.Thread(target=_read_doorbell, args=(sys.stdin.buffer, doorbell, closed), daemon=True).start()
+	synthizer.initialize()
+	engine_executor = executor(synthizer)
+
+	def run(command):
+		op = command[0]
+		if op == "buffer":
+			#Buffers come in their own shared memory block, which the add-on frees once answered.
+			seq, oid, kind, name, size, meta = command[1:]
+			block = ring.attach(name)
+			try:
+				data = bytes(block.buf[:size])
+			finally:
+				block.close()
+			return engine_executor.buffer(oid, kind, data, meta)
+		if op in ("ask", "get", "ping"):
+			return engine_executor.run((op,)+command[2:])
+		return engine_executor.run(command)
+
+	try:
+		serve(commands, replies, run, doorbell, closed)
+	finally:
+		engine_executor.close()
+		synthizer.shutdown()
+		commands.close()
+		replies.close()
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
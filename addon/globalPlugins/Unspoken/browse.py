@@ -0,0 +1,235 @@
+#Browse mode support for Unspoken.
+#Keeps an index of each browse mode document's control fields, so a caret move is resolved to the control it's in with a binary search instead of asking the virtual buffer for fields on every keypress.
+#The index is a sorted list of segment starts; each segment is a run of text whose innermost control with a sound stays the same.
+#It is built once per document off the main thread. When something in the document changes, only that control's range is scanned again and spliced in.
+#Changes can still slip by unannounced, so each control the caret lands in is checked against the document, and indexes are built again once they get old. An old or stale index keeps being used while its replacement is built.
+
+import bisect
+import threading
+import time
+import weakref
+import textInfos
+import textInfos.offsets
+from logHandler import log
+
+#Changed controls waiting to be spliced in. Past this many, the document is indexed again from scratch.
+MAX_PENDING = 64
+#Indexes older than this many seconds are built again.
+MAX_AGE = 30.0
+
+def _length(text):
+	#Virtual buffer offsets count UTF-16 code units.
+	return len(text.encode("utf_16_le"))//2
+
+def _field_id(field):
+	return field.get("controlIdentifier_docHandle"), field.get("controlIdentifier_ID")
+
+def scan(info, roles, target=None):
+	"""Reads info's text with fields. Returns (segments, fields).
+	segments is a list of (start, role, states, field id) at each change of innermost control with a role in roles, or (start, None, None, None) in text outside any.
+	fields maps field ids to [start, end]; with target, only target and what's inside it are recorded."""
+	offset = info._startOffset
+	segments = []
+	fields = {}
+	stack = []
+	recording = target is None
+	current = None
+	for item in info.getTextWithFields():
+		if isinstance(item, str):
+			if not item:
+				continue
+			innermost = (None, None, None)
+			for field_id, role, states, start in reversed(stack):
+				if role in roles:
+					innermost = (role, states, field_id)
+					break
+			if innermost != current:
+				segments.append((offset,)+innermost)
+				current = innermost
+			offset += _length(item)
+		elif isinstance(item, textInfos.FieldCommand):
+			if item.command == "controlStart":
+				field = item.field
+				field_id = _field_id(field)
+				if field_id == target:
+					recording = True
+				states = field.get("states")
+				stack.append((field_id, field.get("role"), frozenset(states) if states else None, offset))
+				if recording:
+					fields[field_id] = [offset, None]
+			elif item.command == "controlEnd" and stack:
+				field_id = stack.pop()[0]
+				if field_id in fields:
+					fields[field_id][1] = offset
+	#Fields still open run to the end of the range.
+	for extent in fields.values():
+		if extent[1] is None:
+			extent[1] = offset
+	return segments, fields
+
+class document_index(object):
+	"""Control fields of one browse mode document. Built on any thread; after that only used from the playback thread."""
+
+	def __init__(self, document, roles):
+		self.document = weakref.ref(document)
+		self.roles = roles
+		started = time.perf_counter()
+		segments, self.fields = scan(document.makeTextInfo(textInfos.POSITION_ALL), roles)
+		self.starts = [segment[0] for segment in segments]
+		self.entries = [segment[1:] for segment in segments]
+		self.pending = []
+		self.stale = False
+		self.built = time.monotonic()
+		log.debug("Unspoken: indexed %d browse mode segments in %.1f ms"%(len(self.starts), (time.perf_counter()-started)*1000))
+
+	def lookup(self, offset):
+		"""Returns (role, states, field id) of the innermost control with a sound at offset, with role None outside any."""
+		i = bisect.bisect_right(self.starts, offset)-1
+		if i < 0:
+			return (None, None, None)
+		return self.entries[i]
+
+	def verify(self, field_id, offset):
+		"""Checks that field_id is where the index has it and that offset is inside it. Marks the index stale and returns False if not."""
+		document = self.document()
+		extent = self.fields.get(field_id)
+		if document is None or extent is None:
+			self.stale = True
+			return False
+		try:
+			start, end = document._getOffsetsFromFieldIdentifier(*field_id)
+		except LookupError:
+			start = end = None
+		except:
+			log.debugWarning("Unspoken: could not check browse mode index", exc_info=True)
+			start = end = None
+		if start != extent[0] or end != extent[1] or not start <= offset <= end:
+			log.debug("Unspoken: browse mode index out of step with its document")
+			self.stale = True
+			return False
+		return True
+
+	def changed(self, obj):
+		"""Notes that obj changed, or with None that controls came or went. Safe from any thread; the work is done by apply_pending()."""
+		if obj is None or len(self.pending) >= MAX_PENDING:
+			self.stale = True
+			return
+		self.pending.append(obj)
+
+	def apply_pending(self):
+		"""Splices in the controls that changed. Returns False if the document has to be indexed again."""
+		document = self.document()
+		if document is None or self.stale:
+			return False
+		while self.pending:
+			obj = self.pending.pop(0)
+			try:
+				field_id = document.getIdentifierFromNVDAObject(obj)
+				if self.update(document, field_id):
+					continue
+			except LookupError:
+				#Gone from the document, along with its text.
+				continue
+			except:
+				log.debugWarning("Unspoken: could not update browse mode index", exc_info=True)
+			self.stale = True
+			return False
+		return True
+
+	def update(self, document, field_id):
+		"""Scans field_id's range again and splices it in, shifting everything after it. Returns False if it can't be done in place."""
+		old = self.fields.get(field_id)
+		if old is None or old[1] is None:
+			return False
+		old_start, old_end = old
+		start, end = document._getOffsetsFromFieldIdentifier(*field_id)
+		if start != old_start:
+			#Something earlier changed without us hearing about it.
+			return False
+		segments, fields = scan(document.makeTextInfo(textInfos.offsets.Offsets(start, end)), self.roles, field_id)
+		delta = (end-start)-(old_end-old_start)
+		#What the text after the control was in, so it doesn't end up inside the control's last segment.
+		after = self.lookup(old_end)
+		i = bisect.bisect_left(self.starts, old_start)
+		j = bisect.bisect_left(self.starts, old_end)
+		tail_starts = [s+delta for s in self.starts[j:]]
+		tail_entries = self.entries[j:]
+		if not tail_starts or tail_starts[0] != end:
+			tail_starts.insert(0, end)
+			tail_entries.insert(0, after)
+		new_starts = [segment[0] for segment in segments]+tail_starts
+		new_entries = [segment[1:] for segment in segments]+tail_entries
+		#Segments that carry on the one before them are merged into it, so the index stays as a full scan would leave it.
+		previous = self.entries[i-1] if i > 0 else None
+		k = 0
+		while k < len(new_entries):
+			if new_entries[k] == previous:
+				del new_starts[k]
+				del new_entries[k]
+			else:
+				previous = new_entries[k]
+				k += 1
+		self.starts[i:] = new_starts
+		self.entries[i:] = new_entries
+		for other, extent in list(self.fields.items()):
+			if extent[1] is None:
+				continue
+			if old_start <= extent[0] and extent[1] <= old_end:
+				#The control itself or something inside it; rescanned above.
+				del self.fields[other]
+			elif extent[0] >= old_end:
+				extent[0] += delta
+				extent[1] += delta
+			elif extent[0] <= old_start and extent[1] >= old_end:
+				#Contains the control.
+				extent[1] += delta
+		self.fields.update(fields)
+		return True
+
+class document_indexes(object):
+	"""Indexes of the open browse mode documents, dropped along with the documents."""
+
+	def __init__(self, roles, max_age=MAX_AGE):
+		self.roles = roles
+		self.max_age = max_age
+		self.indexes = weakref.WeakKeyDictionary()
+		self.lock = threading.Lock()
+
+	def get(self, document):
+		"""The index for document, or None if it hasn't been built.
+		An index that has to be built again is still returned, with stale set, until its replacement is ready; verify() guards each control it gives."""
+		with self.lock:
+			index = self.indexes.get(document)
+		if index is None:
+			return None
+		if time.monotonic()-index.built > self.max_age:
+			index.stale = True
+		index.apply_pending()
+		return index
+
+	def build(self, document):
+		"""Indexes document. Meant for a background thread."""
+		with self.lock:
+			index = self.indexes.get(document)
+			if index is not None and not index.stale:
+				return
+		try:
+			index = document_index(document, self.roles)
+		except:
+			log.debugWarning("Unspoken: could not index browse mode document", exc_info=True)
+			return
+		with self.lock:
+			self.indexes[document] = index
+
+	def changed(self, document, obj):
+		with self.lock:
+			index = self.indexes.get(document)
+		if index is not None:
+			index.changed(obj)
+
+	def invalidate(self, document):
+		with self.lock:
+			self.indexes.pop(document, None)
+
+	def __bool__(self):
+		return bool(self.indexes)
@@ -0,0 +1,85 @@
+#Screen geometry for Unspoken.
+#Maps screen coordinates to angles on the audio display. Monitor rectangles and scale factors are worked out once and kept until the display layout changes.
+
+import wx
+import NVDAObjects
+from logHandler import log
+
+#taken from Stackoverflow. Don't ask.
+def clamp(my_value, min_value, max_value):
+	return max(min(my_value, max_value), min_value)
+
+class monitor(object):
+	"""One monitor's rectangle with its precomputed scale factors."""
+
+	def __init__(self, left, top, width, height, display_width, display_height_min, display_height_magnitude):
+		self.left=left
+		self.top=top
+		self.right=left+width
+		self.bottom=top+height
+		self.center_x=left+width/2.0
+		self.scale_x=display_width/float(width)
+		self.scale_y=display_height_magnitude/float(height)
+		self.offset_y=display_height_min
+
+	def contains(self, x, y):
+		return self.left<=x<self.right and self.top<=y<self.bottom
+
+	def angles(self, x, y):
+		angle_x=(x-self.center_x)*self.scale_x
+		#angle_y is a bit more involved.
+		angle_y=(self.bottom-y)*self.scale_y+self.offset_y
+		#clamp these to Libaudioverse's internal ranges.
+		return clamp(angle_x, -90.0, 90.0), clamp(angle_y, -90.0, 90.0)
+
+class screen_geometry(object):
+	"""Cached monitor layout. refresh() must run on the main thread; angles() may be called from any thread."""
+
+	#these are in degrees.
+	def __init__(self, display_width=180.0, display_height_min=-40.0, display_height_magnitude=50.0):
+		self.display_width=display_width
+		self.display_height_min=display_height_min
+		self.display_height_magnitude=display_height_magnitude
+		self.monitors=()
+		self.center=(0.0, display_height_magnitude/2.0+display_height_min)
+		self.refresh()
+
+	def refresh(self):
+		"""Rebuilds the monitor list. The primary monitor comes first."""
+		monitors=[]
+		try:
+			for i in range(wx.Display.GetCount()):
+				display=wx.Display(i)
+				rect=display.GetGeometry()
+				if rect.width<=0 or rect.height<=0:
+					continue
+				m=self._monitor(rect.x, rect.y, rect.width, rect.height)
+				if display.IsPrimary():
+					monitors.insert(0, m)
+				else:
+					monitors.append(m)
+		except:
+			log.debugWarning("Unspoken: could not enumerate monitors", exc_info=True)
+		if not monitors:
+			#Fall back to the whole desktop, as one screen.
+			left, top, width, height=NVDAObjects.api.getDesktopObject().location
+			monitors.append(self._monitor(left, top, width, height))
+		#Swap in one go, so readers on other threads always see a complete layout.
+		self.monitors=tuple(monitors)
+
+	def _monitor(self, left, top, width, height):
+		return monitor(left, top, width, height, self.display_width, self.display_height_min, self.display_height_magnitude)
+
+	def angles(self, location):
+		"""Angles for the center of a (left, top, width, height) location. Objects without a location are assumed in the center of the screen."""
+		if location is None:
+			return self.center
+		left, top, width, height=location
+		x=left+width/2.0
+		y=top+height/2.0
+		monitors=self.monitors
+		for m in monitors:
+			if m.contains(x, y):
+				return m.angles(x, y)
+		#Off every screen, so use the primary monitor and let clamping handle it.
+		return monitors[0].angles(x, y)
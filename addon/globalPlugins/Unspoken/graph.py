@@ -0,0 +1,125 @@
+#Audio graph for Unspoken.
+#Owns the sound objects, their routes to the reverb and their panner strategy.
+#apply() compares the wanted configuration with what is already built and changes only the difference, so settings take effect at once without tearing down unaffected sources.
+
+import collections
+import threading
+from logHandler import log
+from . import sound
+
+#What the graph should look like. roles maps each role to the name of its sound; those are built up front.
+#variants maps more keys (see variants.variant_table) to sound names; those are built when first played.
+graph_config = collections.namedtuple("graph_config", ("roles", "variants", "reverb", "reverb_level", "reverb_time", "hrtf"))
+
+#Reverb routes fade in and out over this many seconds, so toggling it doesn't click.
+ROUTE_FADE_TIME = 0.05
+
+class graph_manager(object):
+	def __init__(self, sounds, loader):
+		"""sounds is the role to sound3d dict to keep up to date. loader(sound_object, name) loads the sound called name into sound_object."""
+		self.sounds=sounds
+		self.loader=loader
+		self.lock=threading.RLock()
+		self.voices={} #Sound name to sound3d. Roles sharing a sound share one instance.
+		self.routed=set() #Names of sounds routed to the reverb.
+		self.config=None
+		self.suspended=False #Reverb routes are held off while the engine is idle.
+
+	def voice(self, role):
+		"""Returns the sound for role, or a variant key, building it now if needed. Safe to call from any thread."""
+		sound_object=self.sounds.get(role)
+		if sound_object is not None:
+			return sound_object
+		with self.lock:
+			return self._build(role)
+
+	def apply(self, config, build=True):
+		"""Brings the graph in line with config. With build False, sounds are left to be created when first needed."""
+		with self.lock:
+			old=self.config
+			self.config=config
+			if old is None or old.reverb_level!=config.reverb_level:
+				sound.reverb.gain.value=config.reverb_level
+			if old is None or old.reverb_time!=config.reverb_time:
+				sound.reverb.t60.value=config.reverb_time
+			if old is None or old.hrtf!=config.hrtf:
+				strategy=self._strategy(config.hrtf)
+				sound.context.default_panner_strategy.value=strategy
+#The context default only applies to new sources, so existing ones are switched one by one.
+				for sound_object in self.voices.values():
+					sound_object.source.panner_strategy.value=strategy
+			if old is not None and (old.roles!=config.roles or old.variants!=config.variants):
+				for role in list(self.sounds):
+					if _name(config, role)!=_name(old, role):
+						del self.sounds[role]
+				wanted=set(config.roles.values())|set(config.variants.values())
+				for name in list(self.voices):
+					if name not in wanted:
+						self._close(name)
+			if build:
+				for role in config.roles:
+					if role not in self.sounds:
+						self._build(role)
+			self._route_all()
+
+	def suspend(self):
+		"""Fades out every reverb route, so the reverb has no input and nothing left to render. Routes stay off until resume()."""
+		with self.lock:
+			self.suspended=True
+			if self.config is not None:
+				self._route_all()
+
+	def resume(self):
+		"""Fades the reverb routes back in."""
+		with self.lock:
+			self.suspended=False
+			if self.config is not None:
+				self._route_all()
+
+	def close(self):
+		with self.lock:
+			self.sounds.clear()
+			for name in list(self.voices):
+				self._close(name)
+			self.config=None
+
+	def _build(self, role):
+		name=_name(self.config, role)
+		sound_object=self.voices.get(name)
+		if sound_object is None:
+			sound_object=sound.sound3d("3d",sound.context)
+			log.debug("Loading "+name)
+			self.loader(sound_object, name)
+			self.voices[name]=sound_object
+			if self.config.reverb and not self.suspended:
+				self._route(name)
+		self.sounds[role]=sound_object
+		return sound_object
+
+	def _route_all(self):
+		wanted=set(self.voices) if self.config.reverb and not self.suspended else set()
+		for name in wanted-self.routed:
+			self._route(name)
+		for name in self.routed-wanted:
+			self._unroute(name)
+
+	def _route(self, name):
+		sound.context.config_route(self.voices[name].source, sound.reverb, fade_time=ROUTE_FADE_TIME)
+		self.routed.add(name)
+
+	def _unroute(self, name):
+		sound.context.remove_route(self.voices[name].source, sound.reverb, fade_time=ROUTE_FADE_TIME)
+		self.routed.discard(name)
+
+	def _close(self, name):
+		if name in self.routed:
+			self._unroute(name)
+		self.voices.pop(name).close()
+
+	def _strategy(self, hrtf):
+		synthizer=sound.get_synthizer()
+		return synthizer.PannerStrategy.HRTF if hrtf else synthizer.PannerStrategy.STEREO
+
+def _name(config, role):
+	name=config.roles.get(role)
+	return name if name is not None else config.variants.get(role)
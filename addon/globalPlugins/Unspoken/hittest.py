@@ -0,0 +1,103 @@
+#Mouse hit-testing for Unspoken.
+#Keeps a grid of the control rectangles in each recently explored window, so the control under the pointer is found locally instead of asking the application for its role and location on every mouse move.
+#Indexes are built lazily from the object tree on a background thread, and dropped when the window's layout changes or they get old.
+
+import collections
+import threading
+import time
+from logHandler import log
+from . import scan
+
+#Side of a grid cell, in pixels.
+CELL_SIZE = 64
+#Indexes older than this many seconds are rebuilt; scrolling can move things without any event reaching us.
+MAX_AGE = 10.0
+#Windows with an index kept at once.
+MAX_WINDOWS = 4
+
+#Returned by lookup() for a window without an index, or a point outside the indexed window.
+UNKNOWN = object()
+
+class grid_index(object):
+	"""Control rectangles bucketed into square cells. hit() only looks at the cell under the point.
+	bounds is the (left, top, width, height) of the window the controls came from, if known."""
+
+	def __init__(self, controls, bounds=None, cell=CELL_SIZE):
+		self.cell = cell
+		self.bounds = bounds
+		self.cells = {}
+		self.count = len(controls)
+		self.built = time.monotonic()
+		for role, location in controls:
+			left, top, width, height = location
+			entry = (width*height, role, location)
+			for column in range(left//cell, (left+width-1)//cell+1):
+				for row in range(top//cell, (top+height-1)//cell+1):
+					self.cells.setdefault((column, row), []).append(entry)
+		#Smallest first, so the innermost control under the point wins.
+		for bucket in self.cells.values():
+			bucket.sort(key=lambda entry: entry[0])
+
+	def hit(self, x, y):
+		"""Returns (role, location) of the smallest control containing the point, or None."""
+		for area, role, location in self.cells.get((x//self.cell, y//self.cell), ()):
+			left, top, width, height = location
+			if left <= x < left+width and top <= y < top+height:
+				return role, location
+		return None
+
+	def covers(self, x, y):
+		"""Whether the point is inside the indexed window, or the window's bounds aren't known."""
+		if self.bounds is None:
+			return True
+		left, top, width, height = self.bounds
+		return left <= x < left+width and top <= y < top+height
+
+class hit_tester(object):
+	"""Grid indexes for the last few windows, keyed by top-level window handle."""
+
+	def __init__(self, max_age=MAX_AGE):
+		self.max_age = max_age
+		self.indexes = collections.OrderedDict()
+		self.lock = threading.Lock()
+
+	def lookup(self, hwnd, x, y):
+		"""Returns (role, location) under the point, None if there's no control there, or UNKNOWN if the window has no usable index or the point is outside it."""
+		with self.lock:
+			index = self.indexes.get(hwnd)
+			if index is None or time.monotonic()-index.built > self.max_age:
+				return UNKNOWN
+			self.indexes.move_to_end(hwnd)
+		if not index.covers(x, y):
+			return UNKNOWN
+		return index.hit(x, y)
+
+	def has(self, hwnd):
+		with self.lock:
+			index = self.indexes.get(hwnd)
+			return index is not None and time.monotonic()-index.built <= self.max_age
+
+	def build(self, hwnd, root):
+		"""Walks root's tree and indexes it for hwnd. root is the window's own object, whose location bounds the index. Meant for a background thread."""
+		started = time.perf_counter()
+		try:
+			location = root.location
+			controls = scan.walk(root, None, scan.MAX_OBJECTS)
+		except:
+			log.error("Unspoken: could not index window", exc_info=True)
+			return
+		index = grid_index(controls, tuple(location) if location else None)
+		with self.lock:
+			self.indexes[hwnd] = index
+			self.indexes.move_to_end(hwnd)
+			while len(self.indexes) > MAX_WINDOWS:
+				self.indexes.popitem(last=False)
+		log.debug("Unspoken: indexed %d controls in %.1f ms"%(index.count, (time.perf_counter()-started)*1000))
+
+	def invalidate(self, hwnd):
+		with self.lock:
+			self.indexes.pop(hwnd, None)
+
+	def clear(self):
+		with self.lock:
+			self.indexes.clear()
@@ -0,0 +1,84 @@
+#Latency metrics for Unspoken.
+#Off by default. Callers check metrics.enabled before taking any timestamps, so when off the cost is one attribute read per stage.
+
+import bisect
+import collections
+import threading
+import time
+
+enabled = False
+now = time.perf_counter
+
+#Bucket upper bounds in seconds: 10 us to about 10 s, each 25% wider than the last.
+_BOUNDS = []
+_bound = 0.00001
+while _bound < 10.0:
+	_BOUNDS.append(_bound)
+	_bound *= 1.25
+_BOUNDS.append(float("inf"))
+
+class histogram(object):
+	"""Fixed log-scale buckets, so recording is a bisect and an increment and memory never grows."""
+
+	def __init__(self):
+		self.buckets = [0]*len(_BOUNDS)
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def record(self, value):
+		self.buckets[bisect.bisect_left(_BOUNDS, value)] += 1
+		self.count += 1
+		self.total += value
+		if value > self.max:
+			self.max = value
+
+	def percentile(self, p):
+		"""Upper bound of the bucket holding the p-th percentile, in seconds."""
+		if not self.count:
+			return 0.0
+		wanted = self.count*p/100.0
+		seen = 0
+		for bound, n in zip(_BOUNDS, self.buckets):
+			seen += n
+			if seen >= wanted:
+				return min(bound, self.max)
+		return self.max
+
+	def summary(self):
+		return "n=%d mean=%.2f p50=%.2f p95=%.2f p99=%.2f max=%.2f ms"%(
+			self.count,
+			self.total/self.count*1000 if self.count else 0.0,
+			self.percentile(50)*1000,
+			self.percentile(95)*1000,
+			self.percentile(99)*1000,
+			self.max*1000,
+		)
+
+_lock = threading.Lock()
+_histograms = collections.defaultdict(histogram)
+_counters = collections.Counter()
+
+def record(stage, seconds, *labels):
+	"""Adds a timing for stage, and for stage under each label (event type, role...)."""
+	with _lock:
+		_histograms[stage].record(seconds)
+		for label in labels:
+			_histograms["%s/%s"%(stage, label)].record(seconds)
+
+def count(*names):
+	with _lock:
+		for name in names:
+			_counters[name] += 1
+
+def reset():
+	with _lock:
+		_histograms.clear()
+		_counters.clear()
+
+def report():
+	"""Returns the collected metrics as lines of text."""
+	with _lock:
+		lines = ["%s: %s"%(name, _histograms[name].summary()) for name in sorted(_histograms)]
+		lines.extend("%s: %d"%(name, _counters[name]) for name in sorted(_counters))
+	return lines
@@ -0,0 +1,254 @@
+#Headless audio backend for Unspoken.
+#Stands in for the synthizer module with the parts of its API the add-on uses, makes no sound and needs no audio device or Windows.
+#Every property read and write and every method call is recorded with a timestamp in recorder, so the playback logic can be run, profiled and its engine calls counted anywhere.
+
+import collections
+import io
+import itertools
+import threading
+import time
+import wave
+
+class call_recorder(object):
+	"""Keeps the most recent engine calls, and a count of all of them."""
+
+	def __init__(self, limit=100000):
+		self.lock=threading.Lock()
+		self.calls=collections.deque(maxlen=limit)
+		self.counts=collections.Counter()
+		self.total=0
+
+	def record(self, op, target, name, value=None):
+		with self.lock:
+			self.calls.append((time.perf_counter(), op, target, name, value))
+			self.counts[op]+=1
+			self.total+=1
+
+	def mark(self):
+		"""Returns a marker for since()."""
+		return self.total
+
+	def since(self, mark):
+		"""Number of engine calls made after mark was taken."""
+		return self.total-mark
+
+	def clear(self):
+		with self.lock:
+			self.calls.clear()
+			self.counts.clear()
+			self.total=0
+
+recorder=call_recorder()
+_ids=itertools.count(1)
+
+def initialize():
+	recorder.record("initialize", None, None)
+
+def shutdown():
+	recorder.record("shutdown", None, None)
+
+class _property(object):
+	__slots__=("owner", "name", "_value")
+
+	def __init__(self, owner, name, value):
+		self.owner=owner
+		self.name=name
+		self._value=value
+
+	def _get_value(self):
+		recorder.record("get", self.owner, self.name)
+		return self._value
+
+	def _set_value(self, value):
+		recorder.record("set", self.owner, self.name, value)
+		self._value=value
+
+	value=property(_get_value, _set_value)
+
+class _object(object):
+	#Property names with their defaults.
+	_properties={}
+
+	def __init__(self, *args, **kwargs):
+		self.handle=next(_ids)
+		for name, default in self._properties.items():
+			setattr(self, name, _property(self, name, default))
+		recorder.record("create", self, type(self).__name__)
+
+	def destroy(self):
+		recorder.record("destroy", self, type(self).__name__)
+
+	#Contexts, sources and generators can be paused.
+	def pause(self):
+		recorder.record("pause", self, type(self).__name__)
+
+	def play(self):
+		recorder.record("resume", self, type(self).__name__)
+
+	def __repr__(self):
+		return "<%s %d>"%(type(self).__name__, self.handle)
+
+class PannerStrategy(object):
+	DELEGATE=0
+	HRTF=1
+	STEREO=2
+
+class DistanceModel(object):
+	NONE=0
+	LINEAR=1
+	EXPONENTIAL=2
+	INVERSE=3
+
+class BiquadConfig(object):
+	def __init__(self, kind="identity", *args):
+		self.kind=kind
+		self.args=args
+
+	def __repr__(self):
+		return "BiquadConfig%r"%((self.kind,)+self.args,)
+
+	@classmethod
+	def design_identity(cls):
+		return cls()
+
+	@classmethod
+	def design_lowpass(cls, frequency, q=0.7071135624381276):
+		return cls("lowpass", frequency, q)
+
+	@classmethod
+	def design_highpass(cls, frequency, q=0.7071135624381276):
+		return cls("highpass", frequency, q)
+
+	@classmethod
+	def design_bandpass(cls, frequency, bw):
+		return cls("bandpass", frequency, bw)
+
+class Context(_object):
+	_properties={
+		"gain" : 1.0,
+		"position" : (0.0, 0.0, 0.0),
+		"orientation" : (0.0, 1.0, 0.0, 0.0, 0.0, 1.0),
+		"default_panner_strategy" : PannerStrategy.STEREO,
+		"default_distance_model" : DistanceModel.LINEAR,
+		"current_time" : 0.0,
+		"suggested_automation_time" : 0.0,
+	}
+
+	def __init__(self, *args, **kwargs):
+		super(Context, self).__init__(*args, **kwargs)
+		self._started=time.perf_counter()
+
+	def config_route(self, output, input, gain=1.0, fade_time=0.01, filter=None):
+		recorder.record("config_route", self, None, (output, input, gain, fade_time))
+
+	def remove_route(self, output, input, fade_time=0.01):
+		recorder.record("remove_route", self, None, (output, input, fade_time))
+
+class AutomationBatch(_object):
+	"""Collects property changes and applies them all in execute()."""
+
+	def __init__(self, context):
+		super(AutomationBatch, self).__init__()
+		self._points=[]
+
+	def append_property(self, time, prop, value):
+		recorder.record("automate", prop.owner, prop.name, (time, value))
+		self._points.append((prop, value))
+		return self
+
+	def clear_property(self, time, prop):
+		recorder.record("automate_clear", prop.owner, prop.name, time)
+		return self
+
+	def execute(self):
+		recorder.record("execute", self, None, len(self._points))
+		for prop, value in self._points:
+			prop._value=value
+		self._points=[]
+
+class Buffer(_object):
+	def __init__(self, channels=1, frames=0, sample_rate=44100):
+		super(Buffer, self).__init__()
+		self._channels=channels
+		self._frames=frames
+		self._sample_rate=sample_rate
+
+	@classmethod
+	def from_file(cls, path):
+		with open(path, "rb") as f:
+			return cls.from_encoded_data(f.read())
+
+	@classmethod
+	def from_encoded_data(cls, data):
+		#Only WAV headers are understood; anything else becomes an empty buffer.
+		try:
+			with wave.open(io.BytesIO(data), "rb") as w:
+				return cls(w.getnchannels(), w.getnframes(), w.getframerate())
+		except (wave.Error, EOFError):
+			return cls()
+
+	@classmethod
+	def from_float_array(cls, sr, channels, data):
+		return cls(channels, len(data)//channels, sr)
+
+	def get_channels(self):
+		recorder.record("call", self, "get_channels")
+		return self._channels
+
+	def get_length_in_samples(self):
+		recorder.record("call", self, "get_length_in_samples")
+		return self._frames
+
+	def get_length_in_seconds(self):
+		recorder.record("call", self, "get_length_in_seconds")
+		return self._frames/float(self._sample_rate)
+
+	def get_size_in_bytes(self):
+		recorder.record("call", self, "get_size_in_bytes")
+		return self._frames*self._channels*2
+
+class BufferGenerator(_object):
+	_properties={
+		"gain" : 1.0,
+		"pitch_bend" : 1.0,
+		"buffer" : None,
+		"playback_position" : 0.0,
+		"looping" : False,
+	}
+
+class _source(_object):
+	_properties={
+		"gain" : 1.0,
+		"filter" : None,
+	}
+
+	def add_generator(self, generator):
+		recorder.record("play", self, None, generator)
+
+	def remove_generator(self, generator):
+		recorder.record("stop", self, None, generator)
+
+class DirectSource(_source):
+	pass
+
+class PannedSource(_source):
+	_properties=dict(_source._properties, panner_strategy=PannerStrategy.DELEGATE, azimuth=0.0, elevation=0.0, panning_scalar=0.0)
+
+class Source3D(_source):
+	_properties=dict(_source._properties, panner_strategy=PannerStrategy.DELEGATE, position=(0.0, 0.0, 0.0), orientation=(0.0, 1.0, 0.0, 0.0, 0.0, 1.0), distance_model=DistanceModel.NONE)
+
+class GlobalFdnReverb(_object):
+	_properties={
+		"gain" : 1.0,
+		"filter_input" : None,
+		"mean_free_path" : 0.02,
+		"t60" : 1.0,
+		"late_reflections_lf_rolloff" : 1.0,
+		"late_reflections_lf_reference" : 200.0,
+		"late_reflections_hf_rolloff" : 0.5,
+		"late_reflections_hf_reference" : 500.0,
+		"late_reflections_diffusion" : 1.0,
+		"late_reflections_modulation_depth" : 0.01,
+		"late_reflections_modulation_frequency" : 0.5,
+		"late_reflections_delay" : 0.03,
+	}
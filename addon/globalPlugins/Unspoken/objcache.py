@@ -0,0 +1,175 @@
+#Object cache for Unspoken.
+#Remembers the role and location of controls, keyed by an identity that stays the same across the fresh NVDAObject instances NVDA makes for one control.
+#When focus enters a list, tree, menu or toolbar, the neighbouring items are fetched in the background, so arrowing through them mostly plays from here instead of asking the application.
+
+import collections
+import threading
+import time
+import controlTypes
+from logHandler import log
+
+#Containers whose children get prefetched.
+CONTAINER_ROLES = frozenset((
+	controlTypes.ROLE_LIST,
+	controlTypes.ROLE_TREEVIEW,
+	controlTypes.ROLE_MENU,
+	controlTypes.ROLE_MENUBAR,
+	controlTypes.ROLE_POPUPMENU,
+	controlTypes.ROLE_TOOLBAR,
+	controlTypes.ROLE_TABCONTROL,
+))
+#Siblings fetched on each side of the focus.
+PREFETCH_RADIUS = 16
+
+def object_key(obj):
+	"""Returns a hashable identity for the control obj stands for, or None if there isn't a reliable one.
+	Only uses attributes NVDA already holds, apart from the IAccessible2 unique ID and the UIA runtime ID."""
+	hwnd = getattr(obj, 'windowHandle', None)
+	element = getattr(obj, 'UIAElement', None)
+	if element is not None:
+		try:
+			return ("uia", hwnd, tuple(element.getRuntimeId()))
+		except:
+			return None
+	if getattr(obj, 'IAccessibleObject', None) is None:
+		return None
+	try:
+		uniqueID = getattr(obj, 'IA2UniqueID', None)
+	except:
+		uniqueID = None
+	if uniqueID is not None:
+		return ("ia2", hwnd, uniqueID)
+	childID = getattr(obj, 'IAccessibleChildID', None)
+	if not childID:
+		#Plain MSAA with child ID 0 can't be told apart from other objects in the same window.
+		return None
+	return ("msaa", hwnd, getattr(obj, 'event_objectID', None), childID)
+
+class object_cache(object):
+	"""Bounded LRU of key to (role, location, states). Entries also expire after max_age seconds, since scrolling can move items without NVDA telling us."""
+
+	def __init__(self, size=256, max_age=2.0):
+		self.size = size
+		self.max_age = max_age
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		#The container last prefetched, its children's keys in order around the focus then, and whether the walk reached each end of them.
+		self.container = None
+		self.window = []
+		self.ends = (False, False)
+
+	def get(self, key):
+		with self.lock:
+			entry = self.entries.get(key)
+			if entry is None or time.monotonic()-entry[0] > self.max_age:
+				self.misses += 1
+				return None
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return entry[1], entry[2], entry[3]
+
+	def fresh(self, key):
+		"""Whether key has a live entry. Doesn't count as a hit or miss."""
+		with self.lock:
+			entry = self.entries.get(key)
+			return entry is not None and time.monotonic()-entry[0] <= self.max_age
+
+	def put(self, key, role, location, states=None):
+		"""states is None when they weren't fetched."""
+		with self.lock:
+			self.entries[key] = (time.monotonic(), role, location, states)
+			self.entries.move_to_end(key)
+			while len(self.entries) > self.size:
+				self.entries.popitem(last=False)
+
+	def invalidate(self, key):
+		with self.lock:
+			self.entries.pop(key, None)
+
+	def invalidate_window(self, hwnd):
+		"""Drops every entry from window hwnd."""
+		with self.lock:
+			for key in [key for key in self.entries if key[1] == hwnd]:
+				del self.entries[key]
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def fetch(self, obj, wanted=None, key=None, stateful=()):
+		"""Returns (role, location, states) for obj from the cache, or fetches and caches it.
+		If wanted is given, location is only fetched for roles in it and is None otherwise. States are only fetched for roles in stateful, and are None otherwise."""
+		if key is None:
+			key = object_key(obj)
+		if key is not None:
+			entry = self.get(key)
+			if entry is not None:
+				role, location, states = entry
+				refresh = False
+				if location is None and (wanted is None or role in wanted):
+					#Cached by a caller that didn't want this role's location.
+					location = obj.location
+					refresh = True
+				if states is None and role in stateful:
+					#Cached by prefetch, which doesn't fetch states.
+					states = obj.states
+					refresh = True
+				if refresh:
+					self.put(key, role, location, states)
+				return role, location, states
+		role = obj.role
+		location = obj.location if wanted is None or role in wanted else None
+		states = obj.states if role in stateful else None
+		if key is not None:
+			self.put(key, role, location, states)
+		return role, location, states
+
+	def _covered(self, container, key):
+		"""Whether the last prefetch was of container and still has fresh entries for PREFETCH_RADIUS/2 siblings each side of key, so walking again would fetch next to nothing."""
+		if container is None or container != self.container or key not in self.window:
+			return False
+		i = self.window.index(key)
+		margin = PREFETCH_RADIUS//2
+		first = 0 if self.ends[0] else margin
+		last = len(self.window) if self.ends[1] else len(self.window)-margin
+		if not first <= i < last:
+			return False
+		return all(self.fresh(other) for other in self.window[max(0, i-margin):i+margin+1] if other is not None)
+
+	def prefetch(self, obj):
+		"""Caches obj's siblings if its parent is a container, unless the last prefetch still covers them. Meant for a background thread."""
+		parent = obj.parent
+		if parent is None:
+			return
+		container = object_key(parent)
+		key = object_key(obj)
+		if self._covered(container, key):
+			return
+		if parent.role not in CONTAINER_ROLES:
+			return
+		fetched = 0
+		sides = []
+		ends = []
+		for direction in ('next', 'previous'):
+			keys = []
+			sibling = obj
+			for i in range(PREFETCH_RADIUS):
+				sibling = getattr(sibling, direction)
+				if sibling is None:
+					break
+				sibling_key = object_key(sibling)
+				keys.append(sibling_key)
+				if sibling_key is None:
+					continue
+				if not self.fresh(sibling_key):
+					self.put(sibling_key, sibling.role, sibling.location)
+					fetched += 1
+			sides.append(keys)
+			ends.append(sibling is None)
+		following, preceding = sides
+		self.container = container
+		self.window = preceding[::-1]+[key]+following
+		self.ends = (ends[1], ends[0])
+		log.debug("Unspoken: prefetched %d siblings"%fetched)
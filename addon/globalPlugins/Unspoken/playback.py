@@ -0,0 +1,151 @@
+#Playback worker for Unspoken.
+#NVDA events are handed to a single long-lived thread through a small latest-wins queue, so bursts of focus or mouse events never spawn a thread each.
+
+import collections
+import threading
+import time
+from logHandler import log
+from . import metrics
+
+class playback_worker(object):
+	"""Runs a handler on one background thread for queued events. The handler is called as handler(key, *args).
+	Events are keyed by source (focus, mouse, navigator...). A new event replaces any pending event from the same source, and the queue never holds more than max_pending events."""
+
+	def __init__(self, handler, max_pending=4, name="UnspokenPlayback"):
+		self.handler=handler
+		self.max_pending=max_pending
+		self.pending=collections.OrderedDict()
+		self.lock=threading.Condition(threading.Lock())
+		self.running=True
+		#Counters, readable from any thread.
+		self.queued=0
+		self.coalesced=0
+		self.dropped=0
+		self.handled=0
+		self.failed=0
+		self.thread=threading.Thread(target=self._run, name=name, daemon=True)
+		self.thread.start()
+
+	def submit(self, key, *args):
+		"""Queue an event. Returns immediately."""
+		with self.lock:
+			if not self.running:
+				return False
+			self.queued+=1
+			if metrics.enabled:
+				metrics.count("events/%s"%key)
+			if key in self.pending:
+#The pending event from this source is stale now; the new one takes its place at the back of the queue so play order follows arrival order.
+				del self.pending[key]
+				self.coalesced+=1
+			self.pending[key]=(metrics.now() if metrics.enabled else None, args)
+			while len(self.pending)>self.max_pending:
+				self.pending.popitem(last=False)
+				self.dropped+=1
+			self.lock.notify()
+		return True
+
+	def clear(self):
+		with self.lock:
+			self.dropped+=len(self.pending)
+			self.pending.clear()
+
+	def stats(self):
+		with self.lock:
+			return {
+				"queued" : self.queued,
+				"coalesced" : self.coalesced,
+				"dropped" : self.dropped,
+				"handled" : self.handled,
+				"failed" : self.failed,
+				"pending" : len(self.pending),
+			}
+
+	def _run(self):
+		while True:
+			with self.lock:
+				while self.running and not self.pending:
+					self.lock.wait()
+				if not self.running:
+					return
+				key, (queued_at, args) = self.pending.popitem(last=False)
+			if queued_at is not None:
+				metrics.record("handoff", metrics.now()-queued_at, key)
+			try:
+				self.handler(key, *args)
+				self.handled+=1
+			except:
+				self.failed+=1
+				log.debugWarning("Unspoken: error handling %s event"%key, exc_info=True)
+
+	def stop(self, timeout=1.0):
+		with self.lock:
+			self.running=False
+			self.pending.clear()
+			self.lock.notify_all()
+		if self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+
+class token_bucket(object):
+	"""Allows rate events a second on average, with bursts of up to burst events."""
+
+	def __init__(self, rate, burst):
+		self.rate=float(rate)
+		self.burst=float(max(1, burst))
+		self.tokens=self.burst
+		self.last=time.monotonic()
+
+	def take(self, now=None):
+		if now is None:
+			now=time.monotonic()
+		self.tokens=min(self.burst, self.tokens+(now-self.last)*self.rate)
+		self.last=now
+		if self.tokens<1.0:
+			return False
+		self.tokens-=1.0
+		return True
+
+class event_filter(object):
+	"""Decides which events get to play. Only used from the playback thread.
+	The same control reported again within window seconds plays once, whichever source reports it (focus and navigator for one control, say).
+	Past that, each source can rate limit repeats of the control it last played with its own token bucket. A different control always plays, so fast arrowing through a list never loses an item."""
+
+	def __init__(self, window=0.1):
+		self.window=window
+		self.buckets={}
+		#The key each source last played.
+		self.source_keys={}
+		self.last_key=None
+		self.last_obj=None
+		self.last_time=0.0
+		self.deduplicated=0
+		self.limited=0
+
+	def set_rate(self, source, rate, burst):
+		"""Limits source to rate events a second. A rate of 0 removes the limit."""
+		if rate>0:
+			self.buckets[source]=token_bucket(rate, burst)
+		else:
+			self.buckets.pop(source, None)
+
+	def admit(self, source, key, obj=None):
+		"""key identifies the control (see objcache.object_key). Without one, only the same object instance counts as a repeat."""
+		now=time.monotonic()
+		if now-self.last_time<self.window:
+			if (key is not None and key==self.last_key) or (key is None and obj is not None and obj is self.last_obj):
+				self.deduplicated+=1
+				if metrics.enabled:
+					metrics.count("deduplicated/%s"%source)
+				return False
+		repeat=key is not None and key==self.source_keys.get(source)
+		bucket=self.buckets.get(source) if repeat else None
+		if bucket is not None and not bucket.take(now):
+			self.limited+=1
+			if metrics.enabled:
+				metrics.count("limited/%s"%source)
+			return False
+		self.source_keys[source]=key
+		self.last_key=key
+		self.last_obj=obj
+		self.last_time=now
+		return True
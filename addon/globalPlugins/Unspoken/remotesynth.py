@@ -0,0 +1,504 @@
+#Out-of-process audio backend for Unspoken.
+#Looks like the synthizer module to sound.py, but every engine call becomes a command for audiohost.py, which owns the real context and buffers in a process of its own and is fed through a shared memory ring (see ring.py).
+#Property writes, routes, generators and automation batches go out without waiting. Only making a buffer and the startup ping wait for a reply; property reads are answered from the values last written, as in nullsynth, whose property tables are used here too, and the engine's clock is kept here from when the context was made and how long it has played.
+#Every live object and what was last written to it is remembered. When the host dies or stops answering, a new one is started and the objects are made again in it: sounds that were playing stop, but the graph carries on. After MAX_RESTARTS in RESTART_WINDOW seconds, the objects are made in NVDA's own process instead and the host isn't tried again.
+
+import collections
+import importlib
+import itertools
+import os
+import pickle
+import subprocess
+import threading
+import time
+from multiprocessing import shared_memory
+from logHandler import log
+from . import audiohost
+from . import nullsynth
+from . import ring
+
+COMMAND_RING_SIZE = 256*1024
+REPLY_RING_SIZE = 64*1024
+#Seconds to wait for a reply, or for room in a full command ring, before the host is taken for hung.
+REPLY_TIMEOUT = 2.0
+SEND_TIMEOUT = 0.5
+MAX_RESTARTS = 3
+RESTART_WINDOW = 60.0
+ADDON_DIR = os.path.dirname(os.path.abspath(__file__))
+HOST_SCRIPT = os.path.join(ADDON_DIR, "audiohost.py")
+#Properties the engine moves by itself, answered from the context's own clock.
+LIVE_PROPERTIES = frozenset(("suggested_automation_time", "current_time"))
+#How far past the clock automation is aimed, to cover the trip through the ring.
+AUTOMATION_LEAD = 0.02
+
+class host_error(Exception):
+	"""The host died, hung or couldn't be started."""
+
+#Every engine call, and the recovery that can interrupt one, takes this.
+_lock = threading.RLock()
+_transport = None
+_objects = collections.OrderedDict() #Id to live object, oldest first, so they can be made again in order.
+_ids = itertools.count(1)
+_restarts = collections.deque()
+_closing = False
+#Set while objects are being made again, so a failure then goes back to _recover's loop instead of starting a recovery inside it.
+_recovering = False
+#Counters, readable from any thread.
+counters = collections.Counter()
+
+def _encode(value):
+	if isinstance(value, _object):
+		return (audiohost.REF, value.handle)
+	if isinstance(value, _member):
+		return (audiohost.ENUM, value.enum, value.name)
+	if isinstance(value, BiquadConfig):
+		return (audiohost.BIQUAD, value.design, value.args)
+	return value
+
+def _encode_args(args):
+	return [_encode(arg) for arg in args]
+
+class host_transport(object):
+	"""Commands to a host process. Callers hold _lock, so there is only ever one producer for the command ring."""
+
+	def __init__(self, interpreter, engine):
+		self.interpreter = interpreter
+		self.engine = engine
+		self.seq = itertools.count(1)
+		self.commands = ring.spsc_ring(capacity=COMMAND_RING_SIZE, create=True)
+		self.replies = ring.spsc_ring(capacity=REPLY_RING_SIZE, create=True)
+		self.process = None
+		try:
+			self.process = subprocess.Popen(
+				[interpreter, "-I", "-u", HOST_SCRIPT, self.commands.name, self.replies.name, ADDON_DIR, engine],
+				stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+				creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+			)
+			threading.Thread(target=self._forward_errors, name="UnspokenHostLog", daemon=True).start()
+			pid = self.ask(("ping",))
+		except Exception as e:
+			self.close()
+			raise host_error("could not start the audio host with %s: %s"%(interpreter, e))
+		threading.Thread(target=self._watch, name="UnspokenHostWatch", daemon=True).start()
+		log.info("Unspoken: audio host running as process %d"%pid)
+
+	def _forward_errors(self):
+		for line in self.process.stderr:
+			log.debugWarning("Unspoken audio host: "+line.decode("utf-8", "replace").rstrip())
+
+	def _watch(self):
+		code = self.process.wait()
+		if not _closing and _transport is self:
+			log.error("Unspoken: audio host exited with code %r"%code)
+			_recover(self)
+
+	def _put(self, data):
+		commands = self.commands
+		if not commands.put(data):
+			deadline = time.perf_counter()+SEND_TIMEOUT
+			while not commands.put(data):
+				if time.perf_counter() > deadline or self.process.poll() is not None:
+					raise host_error("the audio host stopped reading commands")
+				time.sleep(0.0005)
+				counters["ring full"] += 1
+		#Only rung when the host said it was going to sleep; otherwise it will find the command on its own.
+		if commands.sleeping:
+			try:
+				self.process.stdin.write(b"\0")
+				self.process.stdin.flush()
+			except (OSError, ValueError):
+				raise host_error("the audio host's doorbell is gone")
+		counters["commands"] += 1
+
+	def send(self, command):
+		self._put(pickle.dumps(command, 4))
+
+	def ask(self, command):
+		seq = next(self.seq)
+		self._put(pickle.dumps(command[:1]+(seq,)+command[1:], 4))
+		counters["asks"] += 1
+		deadline = time.perf_counter()+REPLY_TIMEOUT
+		delay = 0.0
+		while True:
+			data = self.replies.get()
+			if data is not None:
+				reply_seq, (status, value) = pickle.loads(data)
+				if reply_seq != seq:
+					#Left over from an ask that timed out.
+					continue
+				if status == "error":
+					raise RuntimeError("audio host: "+value)
+				return value
+			if time.perf_counter() > deadline or self.process.poll() is not None:
+				raise host_error("no reply from the audio host")
+			time.sleep(delay)
+			delay = min(0.001, delay+0.0001)
+
+	def buffer(self, oid, kind, data, meta):
+		#Buffers are too big for the ring, so they go over in a block of their own, freed once the host has copied them.
+		block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+		try:
+			block.buf[:len(data)] = data
+			return self.ask(("buffer", oid, kind, block.name, len(data), meta))
+		finally:
+			block.close()
+			block.unlink()
+
+	def close(self):
+		process = self.process
+		if process is not None and process.poll() is None:
+			try:
+				self.send(("shutdown",))
+				process.stdin.close()
+				process.wait(1.0)
+			except Exception:
+				process.kill()
+		for r in (self.commands, self.replies):
+			try:
+				r.close()
+			except Exception:
+				pass
+
+class local_transport(object):
+	"""Runs commands on the engine in this process, for when there is no host."""
+
+	def __init__(self, engine):
+		self.synthizer = importlib.import_module("."+engine, __package__)
+		self.synthizer.initialize()
+		self.executor = audiohost.executor(self.synthizer)
+
+	def send(self, command):
+		self.executor.run(command)
+
+	def ask(self, command):
+		return self.executor.run(command)
+
+	def buffer(self, oid, kind, data, meta):
+		return self.executor.buffer(oid, kind, data, meta)
+
+	def close(self):
+		self.executor.close()
+		self.synthizer.shutdown()
+
+def _send(command):
+	with _lock:
+		transport = _transport
+		try:
+			transport.send(command)
+		except host_error:
+			if _recovering:
+				raise
+			log.error("Unspoken: lost the audio host", exc_info=True)
+			#What the command did is already in the objects' state, so rebuilding covers it.
+			_recover(transport)
+
+def _recover(failed):
+	"""Replaces a failed host with a new one, or with the engine in this process once restarts run out, and makes every live object again.
+	A new host that fails while the objects are being made counts as another restart."""
+	global _transport, _recovering
+	with _lock:
+		if _transport is not failed or _closing or _recovering:
+			return
+		_recovering = True
+		try:
+			while True:
+				failed.close()
+				now = time.monotonic()
+				_restarts.append(now)
+				while _restarts and now-_restarts[0] > RESTART_WINDOW:
+					_restarts.popleft()
+				_transport = None
+				if len(_restarts) <= MAX_RESTARTS:
+					try:
+						_transport = host_transport(failed.interpreter, failed.engine)
+						counters["restarts"] += 1
+					except host_error:
+						log.error("Unspoken: could not restart the audio host", exc_info=True)
+				if _transport is None:
+					log.error("Unspoken: the audio host keeps failing; running the audio engine inside NVDA from now on")
+					_transport = local_transport(failed.engine)
+					counters["fallbacks"] += 1
+				try:
+					_rebuild()
+					return
+				except host_error:
+					log.error("Unspoken: the new audio host failed while objects were being made again", exc_info=True)
+					failed = _transport
+		finally:
+			_recovering = False
+
+def _rebuild():
+	#Everything is made before anything is set, since properties and routes can point at objects made later.
+	objects = list(_objects.values())
+	for obj in objects:
+		obj._create()
+	for obj in objects:
+		obj._restore()
+
+def initialize(interpreter="", engine="synthizer"):
+	"""Starts the host with the Python interpreter at interpreter, running engine. Without an interpreter, or if it fails to start, the engine runs in this process."""
+	global _transport, _closing
+	_closing = False
+	if interpreter:
+		try:
+			_transport = host_transport(interpreter, engine)
+			return
+		except host_error:
+			log.error("Unspoken: could not start the audio host; running the audio engine inside NVDA", exc_info=True)
+	else:
+		log.warning("Unspoken: no Python interpreter set for the audio host; running the audio engine inside NVDA")
+	_transport = local_transport(engine)
+
+def shutdown():
+	global _transport, _closing
+	with _lock:
+		_closing = True
+		if _transport is not None:
+			_transport.close()
+			_transport = None
+		_objects.clear()
+
+def status():
+	"""A line on where the engine runs and what has been sent to it."""
+	where = "out of process" if isinstance(_transport, host_transport) else "in process"
+	return "audio engine %s: %d commands, %d waited for a reply, %d host restarts, ring full %d times"%(where, counters["commands"], counters["asks"], counters["restarts"], counters["ring full"])
+
+class _property(object):
+	__slots__=("owner", "name", "_value")
+
+	def __init__(self, owner, name, value):
+		self.owner=owner
+		self.name=name
+		self._value=value
+
+	def _get_value(self):
+		if self.name in LIVE_PROPERTIES:
+			return self.owner._live(self.name)
+		return self._value
+
+	def _set_value(self, value):
+		with _lock:
+			self._value=value
+			self.owner._written.add(self.name)
+			_send(("set", self.owner.handle, self.name, _encode(value)))
+
+	value=property(_get_value, _set_value)
+
+class _object(object):
+	_properties={}
+
+	def __init__(self, *args):
+		self.handle=next(_ids)
+		self._args=args
+		self._written=set()
+		self._paused=False
+		for name, default in self._properties.items():
+			setattr(self, name, _property(self, name, default))
+		with _lock:
+			_objects[self.handle]=self
+			try:
+				self._create()
+			except host_error:
+				_recover(_transport)
+
+	def _create(self):
+		_send(("new", self.handle, type(self).__name__, _encode_args(self._args)))
+
+	def _restore(self):
+		for name in self._written:
+			_send(("set", self.handle, name, _encode(getattr(self, name)._value)))
+		if self._paused:
+			self._call("pause")
+
+	def _call(self, method, *args, **kwargs):
+		_send(("call", self.handle, method, _encode_args(args), {k : _encode(v) for k, v in kwargs.items()}))
+
+	def destroy(self):
+		with _lock:
+			if _objects.pop(self.handle, None) is not None:
+				_send(("del", self.handle))
+
+	def pause(self):
+		self._paused=True
+		self._call("pause")
+
+	def play(self):
+		self._paused=False
+		self._call("play")
+
+	def __repr__(self):
+		return "<remote %s %d>"%(type(self).__name__, self.handle)
+
+class _member(object):
+	"""An enum member, known to the host by name."""
+
+	def __init__(self, enum, name):
+		self.enum=enum
+		self.name=name
+
+	def __repr__(self):
+		return "%s.%s"%(self.enum, self.name)
+
+class PannerStrategy(object):
+	DELEGATE=_member("PannerStrategy", "DELEGATE")
+	HRTF=_member("PannerStrategy", "HRTF")
+	STEREO=_member("PannerStrategy", "STEREO")
+
+class DistanceModel(object):
+	NONE=_member("DistanceModel", "NONE")
+	LINEAR=_member("DistanceModel", "LINEAR")
+	EXPONENTIAL=_member("DistanceModel", "EXPONENTIAL")
+	INVERSE=_member("DistanceModel", "INVERSE")
+
+class BiquadConfig(object):
+	"""A filter design, made in the host from its name and arguments."""
+
+	def __init__(self, design, args=()):
+		self.design=design
+		self.args=args
+
+	@classmethod
+	def design_identity(cls):
+		return cls("design_identity")
+
+	@classmethod
+	def design_lowpass(cls, frequency, q=0.7071135624381276):
+		return cls("design_lowpass", (frequency, q))
+
+	@classmethod
+	def design_highpass(cls, frequency, q=0.7071135624381276):
+		return cls("design_highpass", (frequency, q))
+
+	@classmethod
+	def design_bandpass(cls, frequency, bw):
+		return cls("design_bandpass", (frequency, bw))
+
+class Context(_object):
+	_properties=nullsynth.Context._properties
+
+	def __init__(self, *args):
+		self._routes=collections.OrderedDict()
+		#Engine time at a moment, and that moment on the monotonic clock, or None while paused.
+		self._clock=(0.0, None)
+		super(Context, self).__init__(*args)
+
+	def _create(self):
+		super(Context, self)._create()
+		#A new context starts at time 0, playing unless it is to be paused again.
+		self._clock=(0.0, None if self._paused else time.monotonic())
+
+	def _live(self, name):
+		engine_time, since=self._clock
+		if since is not None:
+			engine_time+=time.monotonic()-since
+		if name=="suggested_automation_time":
+			engine_time+=AUTOMATION_LEAD
+		return engine_time
+
+	def pause(self):
+		self._clock=(self._live("current_time"), None)
+		super(Context, self).pause()
+
+	def play(self):
+		if self._clock[1] is None:
+			self._clock=(self._clock[0], time.monotonic())
+		super(Context, self).play()
+
+	def _restore(self):
+		super(Context, self)._restore()
+		for (output, input), gain in self._routes.items():
+			self._call("config_route", output, input, gain=gain)
+
+	def config_route(self, output, input, gain=1.0, fade_time=0.01, filter=None):
+		self._routes[(output, input)]=gain
+		self._call("config_route", output, input, gain=gain, fade_time=fade_time)
+
+	def remove_route(self, output, input, fade_time=0.01):
+		self._routes.pop((output, input), None)
+		self._call("remove_route", output, input, fade_time=fade_time)
+
+class AutomationBatch(object):
+	"""Collects points and sends them as one command in execute(); nothing exists in the host before then."""
+
+	def __init__(self, context):
+		self.context=context
+		self.clears=[]
+		self.points=[]
+
+	def append_property(self, time, prop, value):
+		self.points.append((time, prop.owner.handle, prop.name, _encode(value)))
+		#Rebuilt with where the envelope ends up.
+		prop._value=value
+		prop.owner._written.add(prop.name)
+		return self
+
+	def clear_property(self, time, prop):
+		self.clears.append((time, prop.owner.handle, prop.name))
+		return self
+
+	def execute(self):
+		_send(("automate", self.context.handle, self.clears, self.points))
+		self.clears=[]
+		self.points=[]
+
+	def destroy(self):
+		pass
+
+class Buffer(_object):
+	def __init__(self, kind, data, meta=None):
+		#Kept so the buffer can be made again in a new host.
+		self._payload=(kind, bytes(data), meta)
+		self._channels, self._frames, self._sample_rate, self._size=1, 0, 44100, 0
+		super(Buffer, self).__init__()
+
+	def _create(self):
+		kind, data, meta=self._payload
+		with _lock:
+			self._channels, self._frames, self._sample_rate, self._size=_transport.buffer(self.handle, kind, data, meta)
+
+	@classmethod
+	def from_file(cls, path):
+		with open(path, "rb") as f:
+			return cls.from_encoded_data(f.read())
+
+	@classmethod
+	def from_encoded_data(cls, data):
+		return cls("encoded", data)
+
+	@classmethod
+	def from_float_array(cls, sr, channels, data):
+		return cls("float", data, (sr, channels))
+
+	def get_channels(self):
+		return self._channels
+
+	def get_length_in_samples(self):
+		return self._frames
+
+	def get_length_in_seconds(self):
+		return self._frames/float(self._sample_rate)
+
+	def get_size_in_bytes(self):
+		return self._size
+
+class BufferGenerator(_object):
+	_properties=nullsynth.BufferGenerator._properties
+
+class _source(_object):
+	def add_generator(self, generator):
+		self._call("add_generator", generator)
+
+	def remove_generator(self, generator):
+		self._call("remove_generator", generator)
+
+class DirectSource(_source):
+	_properties=nullsynth.DirectSource._properties
+
+class PannedSource(_source):
+	_properties=nullsynth.PannedSource._properties
+
+class Source3D(_source):
+	_properties=nullsynth.Source3D._properties
+
+class GlobalFdnReverb(_object):
+	_properties=nullsynth.GlobalFdnReverb._properties
@@ -0,0 +1,112 @@
+#Shared memory ring buffer for Unspoken's audio host.
+#One process writes messages and one other process reads them, with no locks between them: the writer only moves the write position and the reader only moves the read position, each publishing its position after the bytes it covers.
+#Several threads in one process may write, but they have to take turns themselves; see remotesynth.host_transport.
+#Layout: write position, read position, the reader's sleeping flag and the capacity in a 64-byte header, then the data. Positions count bytes ever written or read, so full and empty can't be confused. Each message is a 4-byte length and its bytes, wrapping around the end.
+#This file is also imported by audiohost.py running as a script, so it has no imports from the add-on.
+
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+_POSITION = struct.Struct("<Q")
+_FLAG = struct.Struct("<I")
+_LENGTH = struct.Struct("<I")
+WRITE_OFFSET = 0
+READ_OFFSET = 8
+SLEEPING_OFFSET = 16
+CAPACITY_OFFSET = 24
+HEADER_SIZE = 64
+
+def attach(name):
+	"""Opens shared memory made by the other process. It stays that process's to free."""
+	shm = shared_memory.SharedMemory(name=name)
+	if os.name == "posix":
+		#Python would otherwise free it when this process exits.
+		try:
+			resource_tracker.unregister(shm._name, "shared_memory")
+		except Exception:
+			pass
+	return shm
+
+class spsc_ring(object):
+	"""A single producer, single consumer ring of messages in shared memory called name. With create, the memory is made with room for capacity bytes of messages; otherwise an existing ring is opened."""
+
+	def __init__(self, name=None, capacity=0, create=False):
+		if create:
+			self.shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_SIZE+capacity)
+			self.shm.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+			_POSITION.pack_into(self.shm.buf, CAPACITY_OFFSET, capacity)
+		else:
+			self.shm = attach(name)
+		self.name = self.shm.name
+		self.buf = self.shm.buf
+		#Read back from the header, since the mapping can be rounded up to a whole page.
+		self.capacity = self._get(CAPACITY_OFFSET)
+		self.owner = create
+
+	def _get(self, offset, layout=_POSITION):
+		return layout.unpack_from(self.buf, offset)[0]
+
+	def _set(self, offset, value, layout=_POSITION):
+		layout.pack_into(self.buf, offset, value)
+
+	def _copy_in(self, position, data):
+		start = position%self.capacity
+		first = min(len(data), self.capacity-start)
+		self.buf[HEADER_SIZE+start:HEADER_SIZE+start+first] = data[:first]
+		if first < len(data):
+			self.buf[HEADER_SIZE:HEADER_SIZE+len(data)-first] = data[first:]
+
+	def _copy_out(self, position, size):
+		start = position%self.capacity
+		first = min(size, self.capacity-start)
+		data = bytes(self.buf[HEADER_SIZE+start:HEADER_SIZE+start+first])
+		if first < size:
+			data += bytes(self.buf[HEADER_SIZE:HEADER_SIZE+size-first])
+		return data
+
+	def put(self, data):
+		"""Writes one message. Returns False, writing nothing, if there isn't room for it yet. Producer only."""
+		size = _LENGTH.size+len(data)
+		if size > self.capacity:
+			raise ValueError("message of %d bytes doesn't fit a ring of %d"%(len(data), self.capacity))
+		write = self._get(WRITE_OFFSET)
+		if write-self._get(READ_OFFSET)+size > self.capacity:
+			return False
+		self._copy_in(write, _LENGTH.pack(len(data)))
+		self._copy_in(write+_LENGTH.size, data)
+		#Published last, so the reader never sees a position ahead of the bytes.
+		self._set(WRITE_OFFSET, write+size)
+		return True
+
+	def get(self):
+		"""Returns the next message, or None if there is none. Consumer only."""
+		read = self._get(READ_OFFSET)
+		if read == self._get(WRITE_OFFSET):
+			return None
+		size = _LENGTH.unpack(self._copy_out(read, _LENGTH.size))[0]
+		data = self._copy_out(read+_LENGTH.size, size)
+		self._set(READ_OFFSET, read+_LENGTH.size+size)
+		return data
+
+	def empty(self):
+		return self._get(READ_OFFSET) == self._get(WRITE_OFFSET)
+
+	@property
+	def sleeping(self):
+		"""Set by the consumer while it waits for its doorbell, so the producer knows to ring it."""
+		return bool(self._get(SLEEPING_OFFSET, _FLAG))
+
+	@sleeping.setter
+	def sleeping(self, value):
+		self._set(SLEEPING_OFFSET, 1 if value else 0, _FLAG)
+
+	def close(self):
+		"""Unmaps the ring; the owner also frees it."""
+		self.buf = None
+		self.shm.close()
+		if self.owner:
+			try:
+				self.shm.unlink()
+			except FileNotFoundError:
+				pass
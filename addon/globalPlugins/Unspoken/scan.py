@@ -0,0 +1,185 @@
+#Window scan for Unspoken.
+#Walks a window's object tree off the main thread, collecting every control that has a sound along with its location, then plays the lot as a quick sequence on the sound scheduler: an audio map of the layout.
+#UIA windows are read with one cached FindAll for the whole tree; other windows are walked a level at a time.
+#A scan plays on sound objects of its own, straight from the scheduler thread, so each sound starts on time and none is merged away or cut off by the next.
+
+import threading
+from logHandler import log
+from . import graph
+from . import sound
+
+#Bounds on the walk, so a huge tree (a long web page, a big list) can't run away.
+MAX_CONTROLS = 500
+MAX_OBJECTS = 5000
+MAX_DEPTH = 30
+#Copies of each sound a scan keeps, used in turn, so neighbouring controls with the same sound don't cut each other off.
+SCAN_COPIES = 3
+
+def walk(root, roles, limit=MAX_CONTROLS):
+	"""Returns [(role, location)] for the on-screen descendants of root whose role is in roles (or all of them if roles is None), in reading order."""
+	found = _walk_uia(root, roles, limit)
+	if found is None:
+		found = _walk_objects(root, roles, limit)
+	#Top to bottom, then left to right.
+	found.sort(key=lambda item: (item[1][1], item[1][0]))
+	return found
+
+def _walk_uia(root, roles, limit):
+	"""Fetches the control type and bounding rectangle of all of root's descendants in one UIA call, instead of a round trip per object.
+	Returns None if root isn't a UIA object or the call fails, so the caller can walk the objects instead."""
+	element = getattr(root, 'UIAElement', None)
+	if element is None:
+		return None
+	try:
+		import UIAHandler
+		client = UIAHandler.handler.clientObject
+		request = client.CreateCacheRequest()
+		request.AddProperty(UIAHandler.UIA_ControlTypePropertyId)
+		request.AddProperty(UIAHandler.UIA_BoundingRectanglePropertyId)
+		elements = element.FindAllBuildCache(UIAHandler.TreeScope_Descendants, client.ControlViewCondition, request)
+	except:
+		log.debugWarning("Unspoken: could not fetch UIA descendants", exc_info=True)
+		return None
+	found = []
+	for i in range(min(elements.length, MAX_OBJECTS)):
+		if len(found) >= limit:
+			break
+		try:
+			child = elements.GetElement(i)
+			role = UIAHandler.UIAControlTypesToNVDARoles.get(child.CachedControlType)
+			rect = child.CachedBoundingRectangle
+		except:
+			continue
+		location = (rect.left, rect.top, rect.right-rect.left, rect.bottom-rect.top)
+		if role is not None and (roles is None or role in roles) and location[2] > 0 and location[3] > 0:
+			found.append((role, location))
+	return found
+
+def _walk_objects(root, roles, limit):
+	"""Walks root's tree: each object's role and location are fetched once, and children are fetched a whole level at a time."""
+	found = []
+	stack = [(root, 0)]
+	visited = 0
+	while stack and len(found) < limit and visited < MAX_OBJECTS:
+		obj, depth = stack.pop()
+		visited += 1
+		try:
+			role = obj.role
+			location = obj.location
+		except:
+			continue
+		if (roles is None or role in roles) and location is not None and location[2] > 0 and location[3] > 0:
+			found.append((role, tuple(location)))
+		if depth < MAX_DEPTH:
+			try:
+				children = obj.children
+			except:
+				children = []
+			stack.extend((child, depth+1) for child in reversed(children))
+	return found
+
+class scan_voices(object):
+	"""Sound objects for one scan, apart from the ones events play on, so a scan neither races the playback thread for them nor cuts its sounds off.
+	loader(sound_object, role) loads role's sound into a new sound3d; position(location) gives the angles sound3d.trigger takes."""
+
+	def __init__(self, loader, position, reverb=False, copies=SCAN_COPIES):
+		self.loader = loader
+		self.position = position
+		self.reverb = reverb
+		self.copies = copies
+		self.voices = {}
+		self.turns = {}
+		self.length = 0.0
+		self.lock = threading.Lock()
+		self.closed = False
+
+	def prepare(self, roles):
+		"""Builds the copies for roles. Meant for the scan's own thread, so the scheduler only has to trigger them."""
+		for role in roles:
+			if role in self.voices:
+				continue
+			copies = []
+			for i in range(self.copies):
+				sound_object = sound.sound3d("3d", sound.context)
+				try:
+					self.loader(sound_object, role)
+				except:
+					log.debugWarning("Unspoken: could not load scan sound for %s"%role, exc_info=True)
+					break
+				if self.reverb:
+					sound.context.config_route(sound_object.source, sound.reverb, fade_time=graph.ROUTE_FADE_TIME)
+				copies.append(sound_object)
+				self.length = max(self.length, sound_object.length or 0.0)
+			with self.lock:
+				if self.closed:
+					self._close(copies)
+					return
+				self.voices[role] = copies
+				self.turns[role] = 0
+
+	def play(self, role, location):
+		with self.lock:
+			copies = self.voices.get(role)
+			if self.closed or not copies:
+				return
+			turn = self.turns[role]
+			self.turns[role] = (turn+1)%len(copies)
+			angle_x, angle_y = self.position(location)
+			copies[turn].trigger(position=(angle_x, angle_y, 0))
+
+	def close(self):
+		with self.lock:
+			self.closed = True
+			voices, self.voices = self.voices, {}
+		for copies in voices.values():
+			self._close(copies)
+
+	def _close(self, copies):
+		for sound_object in copies:
+			if self.reverb:
+				sound.context.remove_route(sound_object.source, sound.reverb, fade_time=graph.ROUTE_FADE_TIME)
+			sound_object.close()
+
+class window_scan(object):
+	"""One scan of a window. Each control is played on voices (a scan_voices) from the scheduler thread, interval seconds apart, and the voices are closed once the last sound has had time to end."""
+
+	def __init__(self, root, roles, voices, interval, on_done=None):
+		self.roles = roles
+		self.voices = voices
+		self.interval = interval
+		self.on_done = on_done
+		self.handles = []
+		self.lock = threading.Lock()
+		self.cancelled = False
+		self.thread = threading.Thread(target=self._run, args=(root,), name="UnspokenScan", daemon=True)
+		self.thread.start()
+
+	def _run(self, root):
+		try:
+			controls = walk(root, self.roles)
+			self.voices.prepare(set(role for role, location in controls))
+		except:
+			log.error("Unspoken: window scan failed", exc_info=True)
+			controls = []
+		log.debug("Unspoken: scanning %d controls"%len(controls))
+		with self.lock:
+			if self.cancelled:
+				return
+			#Everything is queued up front against one start time, so the sequence keeps its spacing.
+			start = sound.scheduler.now()+self.interval
+			for i, (role, location) in enumerate(controls):
+				self.handles.append(sound.scheduler.call_at(start+i*self.interval, self.voices.play, role, location))
+			self.handles.append(sound.scheduler.call_at(start+len(controls)*self.interval+self.voices.length, self._finish))
+
+	def _finish(self):
+		self.voices.close()
+		if self.on_done is not None:
+			self.on_done(self)
+
+	def cancel(self):
+		with self.lock:
+			self.cancelled = True
+			for handle in self.handles:
+				sound.scheduler.cancel(handle)
+			self.handles = []
+		self.voices.close()
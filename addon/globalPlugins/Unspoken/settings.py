@@ -0,0 +1,76 @@
+#Settings for Unspoken.
+#The hot paths (the speech hook and playback) read the immutable snapshot in settings.current instead of going through config.conf, which does a profile lookup and validation on every read.
+#The snapshot is rebuilt when the configuration is saved, reset or switches profile, and by refresh() after the add-on changes it.
+
+import collections
+import config
+import extensionPoints
+from logHandler import log
+
+spec = {
+	"sayAll" : "boolean(default=False)",
+	"speakRoles" : "boolean(default=False)",
+	"noSounds" : "boolean(default=False)",
+	"HRTF" : "boolean(default=True)",
+	"volumeAdjust" : "boolean(default=True)",
+	"Reverb" : "boolean(default=True)",
+	"ReverbLevel" : "float(default=1.0)",
+	"ReverbTime" : "float(default=0.2)",
+	"voices" : "integer(default=1, min=1, max=8)",
+	"bufferBudget" : "integer(default=0, min=0)",
+	"backend" : "option('synthizer', 'null', 'remote', default='synthizer')",
+	#Python interpreter that runs the audio host for the remote backend. It has to be one Synthizer's bundled module is built for (32-bit Python 3.8 or 3.11).
+	"hostPython" : "string(default='')",
+	"metrics" : "boolean(default=False)",
+	"scanInterval" : "integer(default=60, min=10, max=1000)",
+	#Most sounds a second each event source may play for the same control again, 0 for no limit, and how many may come at once. Moving to a different control is never limited.
+	"focusRate" : "integer(default=30, min=0)",
+	"navigatorRate" : "integer(default=30, min=0)",
+	"mouseRate" : "integer(default=15, min=0)",
+	"rateBurst" : "integer(default=4, min=1)",
+	#Move the sound with the mouse pointer while it stays on one control, instead of playing it once at the control's center.
+	"mouseTracking" : "boolean(default=False)",
+	#Play checked, expanded, unavailable and similar controls with a changed version of their sound.
+	"stateSounds" : "boolean(default=True)",
+	#Play the sound of each control the caret moves into in browse mode.
+	"browseMode" : "boolean(default=True)",
+	#Play the values of sliders, dials, spin buttons and progress bars as they change.
+	"valueSounds" : "boolean(default=True)",
+	#Seconds without a sound before the audio engine and reverb are suspended, 0 to keep them running.
+	"idleTimeout" : "integer(default=30, min=0)",
+}
+
+snapshot = collections.namedtuple("snapshot", list(spec))
+
+#The settings in effect. Replaced as a whole, never modified, so any thread can read it without locking.
+current = None
+
+#Notified with snapshot= after every rebuild.
+changed = extensionPoints.Action()
+
+def refresh():
+	global current
+	section = config.conf["unspoken"]
+	new = snapshot(**{key : section[key] for key in spec})
+	if new == current:
+		return
+	current = new
+	changed.notify(snapshot=new)
+
+def _onConfigChange(*args, **kwargs):
+	try:
+		refresh()
+	except:
+		log.error("Unspoken: could not reload settings", exc_info=True)
+
+def initialize():
+	config.conf.spec["unspoken"] = spec
+	refresh()
+	config.post_configSave.register(_onConfigChange)
+	config.post_configReset.register(_onConfigChange)
+	config.post_configProfileSwitch.register(_onConfigChange)
+
+def terminate():
+	config.post_configSave.unregister(_onConfigChange)
+	config.post_configReset.unregister(_onConfigChange)
+	config.post_configProfileSwitch.unregister(_onConfigChange)
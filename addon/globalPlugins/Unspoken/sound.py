@@ -1,42 +1,346 @@
 import time
+import os
+import hashlib
 import math
 import random
+import collections
+import threading
+import importlib
+import heapq
+import itertools
+import concurrent.futures
+try:
+	from logHandler import log
+except ImportError:
+#Running outside NVDA, e.g. profiling with the null backend.
+	import logging
+	log=logging.getLogger("Unspoken")
 
 _synthizer_initialized = False
 _synthizer_module = None
+#Audio backends, each a module with the parts of the Synthizer API used here.
+#"null" makes no sound and records every engine call instead; see nullsynth.py.
+#"remote" runs Synthizer in a process of its own; see remotesynth.py.
+backends = {
+	"synthizer" : "synthizer",
+	"null" : "nullsynth",
+	"remote" : "remotesynth",
+}
+backend = None
 context = None
 reverb = None
 #Sound buffer class, for handling synthizer sound buffers.
 class sound_buffer(object):
-	def __init__(self,filename,buffer):
-		self.filename=filename
+	def __init__(self,key,buffer,size):
+		self.key=key
 		self.buffer=buffer
+		self.size=size
+		self.refs=0
 
 	def destroy(self):
 		self.buffer.destroy()
 
 #Sound buffer manager class, for passing already loaded sound buffers if they exist, else creating new ones.
+#Buffers are keyed by a hash of the file contents, so identical audio under different names is only decoded once.
+#Buffers are reference counted. Unused ones are kept around for reuse until they go over the byte budget, oldest first.
 class sound_buffer_manager(object):
-	def __init__(self):
-		self.buffers=[]
+	def __init__(self, budget=0):
+		self.budget=budget #In bytes, 0 for no limit.
+		self.buffers={} #Content hash to sound_buffer.
+		self.handles={} #id of the synthizer buffer to sound_buffer.
+		self.paths={} #(path, mtime, size) to content hash, so a file is only hashed once.
+		self.unused=collections.OrderedDict() #Unreferenced buffers, least recently used first.
+		self.size=0
+		self.lock=threading.RLock()
 
 	def buffer(self,filename):
-		for i in self.buffers:
-			if i.filename==filename:
+		"""Returns the buffer for filename and adds a reference to it. Call release when done with it."""
+		with self.lock:
+			data=None
+			st=os.stat(filename)
+			path_key=(os.path.normcase(os.path.abspath(filename)), st.st_mtime_ns, st.st_size)
+			key=self.paths.get(path_key)
+			if key is None:
+				with open(filename, "rb") as f:
+					data=f.read()
+				key=hashlib.sha1(data).hexdigest()
+				self.paths[path_key]=key
+			entry=self.buffers.get(key)
+			if entry is None:
+#Our sound is not loaded, so load it and add it to the cache.
+				synthizer = get_synthizer()
+				if data is None:
+					with open(filename, "rb") as f:
+						data=f.read()
+				tmp=synthizer.Buffer.from_encoded_data(data)
+				entry=sound_buffer(key, tmp, _buffer_size(tmp))
+				self.buffers[key]=entry
+				self.handles[id(tmp)]=entry
+				self.size+=entry.size
+			entry.refs+=1
+			self.unused.pop(key, None)
 #Our sound is already loaded into a buffer, so return it.
-				return i.buffer
-#Our sound is not loaded, so load it, add the buffer to the buffers list and return it.
-		synthizer = get_synthizer()
-		tmp=synthizer.Buffer.from_file(filename)
-		self.buffers.append(sound_buffer(filename,tmp))
-		return tmp
+			return entry.buffer
+
+	def pack_buffer(self,pack,name):
+		"""Returns the buffer for sound name in a soundpack.sound_pack and adds a reference to it.
+		The samples are already decoded, so the buffer is built straight from the pack's memory."""
+		with self.lock:
+			key=pack.hash(name)
+			entry=self.buffers.get(key)
+			if entry is None:
+				synthizer = get_synthizer()
+				samples=pack.samples(name)
+				try:
+					tmp=synthizer.Buffer.from_float_array(pack.sample_rate, pack.channels(name), samples)
+				finally:
+#Synthizer copies the samples, so the view can go and the pack can be closed later.
+					samples.release()
+				entry=sound_buffer(key, tmp, _buffer_size(tmp))
+				self.buffers[key]=entry
+				self.handles[id(tmp)]=entry
+				self.size+=entry.size
+			entry.refs+=1
+			self.unused.pop(key, None)
+			return entry.buffer
+
+	def rendered_buffer(self,key,render):
+		"""Returns the buffer cached under key and adds a reference to it, calling render() to make it the first time.
+		render returns (sample rate, channels, float samples), for sounds worked out in Python rather than decoded."""
+		with self.lock:
+			entry=self.buffers.get(key)
+			if entry is None:
+				synthizer = get_synthizer()
+				sample_rate, channels, samples=render()
+				tmp=synthizer.Buffer.from_float_array(sample_rate, channels, samples)
+				entry=sound_buffer(key, tmp, _buffer_size(tmp))
+				self.buffers[key]=entry
+				self.handles[id(tmp)]=entry
+				self.size+=entry.size
+			entry.refs+=1
+			self.unused.pop(key, None)
+			return entry.buffer
+
+	def release(self,buffer):
+		"""Drops a reference taken by buffer(). Unreferenced buffers stay cached while within the budget."""
+		with self.lock:
+			entry=self.handles.get(id(buffer))
+			if entry is None or entry.refs<=0:
+				return
+			entry.refs-=1
+			if entry.refs==0:
+				self.unused[entry.key]=entry
+				self._evict()
 
 	def destroy(self,buffer):
-#Not used anywhere yet, todo.
-		buffer.destroy()
-		self.buffers.remove(self)
+		"""Frees buffer right away, whatever its reference count."""
+		with self.lock:
+			entry=self.handles.get(id(buffer))
+			if entry is None:
+				buffer.destroy()
+				return
+			self._free(entry)
+
+	def set_budget(self, budget):
+		with self.lock:
+			self.budget=budget
+			self._evict()
+
+	def clear(self):
+		"""Frees every unused buffer."""
+		with self.lock:
+			while self.unused:
+				self._free(self.unused.popitem(last=False)[1])
+
+	def _evict(self):
+		if not self.budget:
+			return
+		while self.unused and self.size>self.budget:
+			self._free(self.unused.popitem(last=False)[1])
+
+	def _free(self, entry):
+		self.unused.pop(entry.key, None)
+		del self.buffers[entry.key]
+		del self.handles[id(entry.buffer)]
+		for k in [k for k, v in self.paths.items() if v==entry.key]:
+			del self.paths[k]
+		self.size-=entry.size
+		entry.destroy()
+
+def _buffer_size(buffer):
+	"""Bytes held by a decoded buffer."""
+	try:
+		return buffer.get_size_in_bytes()
+	except AttributeError:
+#Synthizer keeps decoded audio as 16-bit samples.
+		return buffer.get_length_in_samples()*buffer.get_channels()*2
 
 gsbm=sound_buffer_manager()
+
+#Voice allocator, for keeping track of which sounds are playing so only those have to be stopped.
+#With max_voices above 1, up to that many sounds can overlap; the oldest one is stolen when the pool is full.
+class voice_allocator(object):
+	def __init__(self, max_voices=1):
+		self.max_voices=max(1, max_voices)
+		self.active=collections.deque()
+		self.lock=threading.Lock()
+
+	def allocate(self, voice):
+		"""Makes room for voice and marks it active. The caller sets up and plays it afterwards."""
+		with self.lock:
+			if voice in self.active:
+#Retriggering a voice that is still sounding, so it just restarts in place.
+				self.active.remove(voice)
+				voice.stop()
+			while len(self.active)>=self.max_voices:
+				self.active.popleft().stop()
+			self.active.append(voice)
+		return voice
+
+	def release(self, voice):
+		with self.lock:
+			if voice in self.active:
+				self.active.remove(voice)
+				voice.stop()
+
+	def stop_all(self):
+		with self.lock:
+			while self.active:
+				self.active.popleft().stop()
+
+	def set_max_voices(self, max_voices):
+		with self.lock:
+			self.max_voices=max(1, max_voices)
+			while len(self.active)>self.max_voices:
+				self.active.popleft().stop()
+#Event scheduler: one thread that runs callbacks at given times.
+#Deadlines are absolute, so a sequence scheduled in one go keeps its timing however long each callback takes; nothing sleeps per sound.
+class event_scheduler(object):
+	def __init__(self, name="UnspokenScheduler"):
+		self.name=name
+		self.queue=[]
+		self.counter=itertools.count()
+		self.lock=threading.Condition(threading.Lock())
+		self.thread=None
+		self.running=True
+
+	@staticmethod
+	def now():
+		return time.perf_counter()
+
+	def call_at(self, when, callback, *args):
+		"""Runs callback(*args) at time when, on the scheduler thread. Returns a handle for cancel()."""
+		entry=[when, next(self.counter), callback, args]
+		with self.lock:
+			if not self.running:
+				return None
+			if self.thread is None:
+				self.thread=threading.Thread(target=self._run, name=self.name, daemon=True)
+				self.thread.start()
+			heapq.heappush(self.queue, entry)
+			if self.queue[0] is entry:
+				self.lock.notify()
+		return entry
+
+	def call_later(self, delay, callback, *args):
+		return self.call_at(self.now()+delay, callback, *args)
+
+	def cancel(self, handle):
+		"""Stops a scheduled callback from running. Cancelled entries are dropped when they come due."""
+		if handle is not None:
+			handle[2]=None
+
+	def _run(self):
+		while True:
+			with self.lock:
+				while self.running:
+					if not self.queue:
+						self.lock.wait()
+						continue
+					delay=self.queue[0][0]-self.now()
+					if delay<=0:
+						break
+					self.lock.wait(delay)
+				if not self.running:
+					return
+				when, seq, callback, args=heapq.heappop(self.queue)
+			if callback is None:
+				continue
+			try:
+				callback(*args)
+			except Exception:
+				log.error("Unspoken: scheduled callback failed", exc_info=True)
+
+	def stop(self, timeout=1.0):
+		with self.lock:
+			self.running=False
+			self.queue=[]
+			self.lock.notify_all()
+		if self.thread is not None and self.thread is not threading.current_thread():
+			self.thread.join(timeout)
+
+scheduler=event_scheduler()
+
+#Envelopes the engine can't run itself are stepped on the scheduler this often, in seconds.
+ENVELOPE_STEP=0.01
+
+class envelope(object):
+	"""Moves a property through a list of (seconds from start, value) points, linearly, on the scheduler thread.
+	future completes with the last value, or can be cancelled to stop the envelope where it is."""
+
+	def __init__(self, prop, points, future):
+		self.prop=prop
+		self.points=points
+		self.future=future
+		self.start=scheduler.now()
+		self.steps=0
+		self.index=0
+
+	def step(self):
+		if self.future.cancelled():
+			return
+		elapsed=scheduler.now()-self.start
+		points=self.points
+		while self.index<len(points)-1 and points[self.index+1][0]<=elapsed:
+			self.index+=1
+		if self.index>=len(points)-1:
+			value=points[-1][1]
+			self.prop.value=value
+			self.future.set_result(value)
+			return
+		(t0, v0), (t1, v1)=points[self.index], points[self.index+1]
+		self.prop.value=v0+(v1-v0)*(elapsed-t0)/(t1-t0)
+#Steps are due at fixed times from the start, so a late step doesn't push back the rest.
+		self.steps+=1
+		scheduler.call_at(self.start+self.steps*ENVELOPE_STEP, self.step)
+
+def automate(context, prop, points):
+	"""Moves prop through points, a list of (seconds from now, value) starting at 0, and returns straight away.
+	Returns a concurrent.futures.Future that completes with the final value when the envelope ends.
+	With automation batches the engine interpolates between the points itself and the scheduler only completes the future; otherwise the scheduler thread steps the property. Only the stepped kind stops early when the future is cancelled."""
+	future=concurrent.futures.Future()
+	duration=points[-1][0]
+	batch_class=getattr(_synthizer_module, "AutomationBatch", None)
+	if batch_class is not None and not _automation_failed:
+		try:
+			base=context.suggested_automation_time.value
+			batch=batch_class(context)
+			batch.clear_property(base, prop)
+			for offset, value in points:
+				batch.append_property(base+offset, prop, value)
+			batch.execute()
+			batch.destroy()
+			scheduler.call_later(duration, _resolve, future, points[-1][1])
+			return future
+		except Exception:
+			log.debugWarning("Unspoken: engine automation failed, stepping envelopes instead", exc_info=True)
+	scheduler.call_later(0, envelope(prop, points, future).step)
+	return future
+
+def _resolve(future, value):
+	if not future.done():
+		future.set_result(value)
+
 #The actual sound3D class.
 class sound3d(object):
 	def __init__(self, type,context):
@@ -51,15 +355,33 @@ class sound3d(object):
 		self.source=None
 		self.generator=None
 		self.length=None
+		self.looping=False
+#Last values sent by trigger, so unchanged ones aren't sent again.
+		self._position=None
+		self._gain=None
+		self._rewound=True
+		self._pitch=1.0
 
-	def load(self, filename):
+	def load(self, filename, pack=None, buffer=None):
+		"""Loads a sound from a path on disk, or by name from a soundpack.sound_pack if pack is given.
+		buffer is a buffer already taken from gsbm, whose reference passes to the sound; filename is then only its name."""
 		if self.handle!=None: self.close()
-		if isinstance(filename, str): # Asume path on disk.
+		if pack is not None or buffer is not None or isinstance(filename, str):
 			synthizer = get_synthizer()
 			self.generator=synthizer.BufferGenerator(self.context)
-			self.buffer=gsbm.buffer(filename)
+			if buffer is not None:
+				self.buffer=buffer
+			elif pack is not None:
+				self.buffer=gsbm.pack_buffer(pack, filename)
+			else: # Asume path on disk.
+				self.buffer=gsbm.buffer(filename)
 			self.length=self.buffer.get_length_in_seconds()
 			self.generator.buffer.value=self.buffer
+			self.looping=False
+			self._position=None
+			self._gain=None
+			self._rewound=True
+			self._pitch=1.0
 			if self.type=="3d":
 				self.source = synthizer.Source3D(self.context)
 			elif self.type=="direct":
@@ -77,6 +399,7 @@ class sound3d(object):
 		self.source.remove_generator(self.generator)
 		self.source.destroy()
 		self.generator.destroy()
+		gsbm.release(self.buffer)
 		self.source=None
 		self.buffer=None
 		self.generator=None
@@ -85,29 +408,68 @@ class sound3d(object):
 	def play(self):
 		if not self.is_active():
 			return False
+		activity(self.length or 0.0)
 		self.generator.looping.value=False
 		self.source.add_generator(self.generator)
 		self.paused=False
 		self.looping=False
+		self._rewound=False
+		return True
+
+	def trigger(self, position=None, gain=None, playback_position=0.0):
+		"""Sets up and starts the sound, and returns straight away.
+		Position and gain are committed together as one automation batch when the backend has them, so the engine applies both on the same audio block.
+		Values that haven't changed since the last trigger aren't sent again, and the generator is attached last, so nothing is rendered with half-applied settings."""
+		if self.source is None:
+			return False
+		activity(self.length or 0.0)
+		updates=[]
+		if position is not None and position!=self._position:
+			updates.append((self.source.position, position))
+			self._position=position
+		if gain is not None and gain!=self._gain:
+			updates.append((self.source.gain, gain))
+			self._gain=gain
+		if updates:
+			commit(self.context, updates)
+		if playback_position or not self._rewound:
+			self.generator.playback_position.value=playback_position
+		if self.looping:
+			self.generator.looping.value=False
+			self.looping=False
+		self.source.add_generator(self.generator)
+		self.paused=False
+		self._rewound=False
+		return True
+
+	def move(self, position):
+		"""Moves the source without restarting whatever it is playing."""
+		if self.source is None or position==self._position:
+			return False
+		commit(self.context, [(self.source.position, position)])
+		self._position=position
 		return True
 
 	def play_looped(self):
 		if not self.is_active():
 			return False
+		activity(self.length or 0.0)
 		self.generator.looping.value=True
 		self.source.add_generator(self.generator)
 		self.paused=False
 		self.looping=True
+		self._rewound=False
 		return True
 
 	def play_wait(self):
+		"""Plays the sound once and returns a Future that completes when it has finished, or None if nothing is loaded.
+		Nothing waits for it: the end is worked out from the length and pitch, and the scheduler completes the future then."""
 		if not self.is_active():
-			return False
-		self.generator.looping=False
+			return None
 		self.play()
-		while self.is_playing():
-			time.sleep(0.005)
-		return True
+		future=concurrent.futures.Future()
+		scheduler.call_later(self.length/self._pitch, _resolve, future, True)
+		return future
 
 	def is_playing(self):
 		return self.position<=self.length-0.005
@@ -124,16 +486,18 @@ class sound3d(object):
 		self.source.remove_generator(self.generator)
 		self.generator.playback_position.value=0
 		self.paused=False
+		self._rewound=True
 
 	def get_position(self):
 		if not self.is_active():
 			return -1
-		return self.generator.playback_position
+		return self.generator.playback_position.value
 
 	def set_position(self, position):
 		if not self.is_active():
 			return False
-		self.generator.playback_position=position
+		self.generator.playback_position.value=position
+		self._rewound=False
 		return True
 
 	def get_volume(self):
@@ -147,12 +511,13 @@ class sound3d(object):
 		if volume>0: volume=0
 		self.vol=volume
 #using formula from the example code to convert to DB
-		self.source.gain=10**(volume/20)
+		self._gain=10**(volume/20)
+		self.source.gain.value=self._gain
 
 	def get_pitch(self):
 		if not self.is_active():
 			return 100
-		return self.generator.pitch_bend*100
+		return self._pitch*100
 
 	def set_pitch(self, pitch):
 		if not self.is_active():
@@ -160,13 +525,14 @@ class sound3d(object):
 		freq=(float(pitch)/100)
 		if freq>10: freq=10
 		if freq<0.1: freq=0.1
-		self.generator.pitch_bend=freq
+		self._pitch=freq
+		self.generator.pitch_bend.value=freq
 
 	def get_pan(self):
 		if not self.is_active():
 			return 0
 		if self.type=="panned":
-			return int(self.source.panning_scaler*100)
+			return int(self.source.panning_scalar.value*100)
 		else:
 			return 0
 
@@ -175,7 +541,7 @@ class sound3d(object):
 			return False
 		if self.type!="panned":
 			return False
-		self.source.panning_scalar=pan/100
+		self.source.panning_scalar.value=pan/100
 
 	def is_active(self):
 		if self.source!=None:
@@ -193,18 +559,197 @@ class sound3d(object):
 
 #Fade a sound.
 	def fade(self,dest_volume, time_per_fade):
-		while self.volume!=dest_volume:
-			if self.volume<dest_volume: self.volume=self.volume+1
-			if self.volume>dest_volume: self.volume=self.volume-1
-			time.sleep(time_per_fade/1000)
-		self.stop()
-		return True
+		"""Fades to dest_volume dB, taking time_per_fade milliseconds per dB, then stops the sound.
+		Returns a Future for the end of the fade, or None if nothing is loaded."""
+		if not self.is_active():
+			return None
+		if dest_volume>0: dest_volume=0
+		volume=self.vol
+		direction=1 if dest_volume>volume else -1
+#One point per dB, as the old stepped fade had, with the engine interpolating in between.
+		points=[(0.0, 10**(volume/20))]
+		while volume!=dest_volume:
+			volume=volume+direction if abs(dest_volume-volume)>=1 else dest_volume
+			points.append((len(points)*time_per_fade/1000.0, 10**(volume/20)))
+		if len(points)==1:
+			points.append((0.0, points[0][1]))
+		self.vol=dest_volume
+		self._gain=points[-1][1]
+		future=automate(self.context, self.source.gain, points)
+		future.add_done_callback(self._fade_done)
+		return future
+
+	def _fade_done(self, future):
+		if not future.cancelled():
+			self.stop()
+
+#Idle suspension: the engine keeps mixing, panning and running the reverb even when nothing plays, so it is paused once it has been idle a while.
+class idle_monitor(object):
+	"""Pauses the context once nothing has played for timeout seconds, and plays it again as the next sound starts.
+	on_suspend runs first and gets settle seconds to fade things out before the pause; on_resume runs right after the context plays again. Both are called with the monitor's lock held.
+	Process CPU time is sampled at each change, so the time spent active and suspended, and the CPU used in each, can be compared."""
+
+	ACTIVE="active"
+	DETACHING="detaching"
+	SUSPENDED="suspended"
+
+	def __init__(self, context, timeout, on_suspend=None, on_resume=None, settle=0.05):
+		self.context=context
+		self.timeout=timeout
+		self.on_suspend=on_suspend
+		self.on_resume=on_resume
+		self.settle=settle
+		self.lock=threading.RLock()
+		self.state=self.ACTIVE
+		self.last=scheduler.now()
+		self.check_handle=None
+		self.pause_handle=None
+		self.can_pause=True
+		self.suspensions=0
+#Seconds of wall and CPU time spent in each state, and when the current state began.
+		self.wall={self.ACTIVE : 0.0, self.SUSPENDED : 0.0}
+		self.cpu={self.ACTIVE : 0.0, self.SUSPENDED : 0.0}
+		self.mark=(self.last, time.process_time())
+		self._arm()
+
+	def touch(self, busy=0.0):
+		"""Notes that a sound is starting and will play for busy seconds, resuming the engine first if needed."""
+		with self.lock:
+			now=scheduler.now()
+			if now+busy>self.last:
+				self.last=now+busy
+			if self.state!=self.ACTIVE:
+				self._resume()
+			if self.check_handle is None:
+				self._arm()
+
+	def set_timeout(self, timeout):
+		"""Seconds of silence before suspending, 0 to never suspend."""
+		with self.lock:
+			self.timeout=timeout
+			if not timeout and self.state!=self.ACTIVE:
+				self._resume()
+			scheduler.cancel(self.check_handle)
+			self.check_handle=None
+			self._arm()
+
+	def stats(self):
+		"""Returns wall and CPU seconds spent active and suspended, counting the current state up to now."""
+		with self.lock:
+			wall=dict(self.wall)
+			cpu=dict(self.cpu)
+			state=self.SUSPENDED if self.state==self.SUSPENDED else self.ACTIVE
+			wall[state]+=scheduler.now()-self.mark[0]
+			cpu[state]+=time.process_time()-self.mark[1]
+			return {
+				"state" : self.state,
+				"suspensions" : self.suspensions,
+				"active_wall" : wall[self.ACTIVE],
+				"active_cpu" : cpu[self.ACTIVE],
+				"suspended_wall" : wall[self.SUSPENDED],
+				"suspended_cpu" : cpu[self.SUSPENDED],
+			}
+
+	def close(self):
+		with self.lock:
+			scheduler.cancel(self.check_handle)
+			scheduler.cancel(self.pause_handle)
+			self.check_handle=self.pause_handle=None
+			if self.state!=self.ACTIVE:
+				self._resume()
+			self.timeout=0
+
+	def _arm(self):
+		if self.timeout:
+			self.check_handle=scheduler.call_at(self.last+self.timeout, self._check)
+
+	def _check(self):
+		with self.lock:
+			self.check_handle=None
+			if not self.timeout or self.state!=self.ACTIVE:
+				return
+			if scheduler.now()<self.last+self.timeout:
+				self._arm()
+				return
+			self.state=self.DETACHING
+			if self.on_suspend is not None:
+				self.on_suspend()
+			self.pause_handle=scheduler.call_later(self.settle, self._pause)
+
+	def _pause(self):
+		with self.lock:
+			self.pause_handle=None
+			if self.state!=self.DETACHING:
+				return
+			if self.can_pause:
+				try:
+					self.context.pause()
+				except Exception:
+#Older engines can't pause a context; the reverb stays detached, which is most of the saving.
+					self.can_pause=False
+					log.debugWarning("Unspoken: could not pause the audio context", exc_info=True)
+			self._account(self.ACTIVE)
+			self.state=self.SUSPENDED
+			self.suspensions+=1
+			log.debug("Unspoken: audio suspended after %d s idle"%self.timeout)
+
+	def _resume(self):
+		scheduler.cancel(self.pause_handle)
+		self.pause_handle=None
+		if self.state==self.SUSPENDED:
+			if self.can_pause:
+				self.context.play()
+			self._account(self.SUSPENDED)
+		self.state=self.ACTIVE
+		if self.on_resume is not None:
+			self.on_resume()
+
+	def _account(self, state):
+		now=(scheduler.now(), time.process_time())
+		self.wall[state]+=now[0]-self.mark[0]
+		self.cpu[state]+=now[1]-self.mark[1]
+		self.mark=now
+
+#The idle_monitor for the context, once the add-on has set one up.
+idle=None
+
+def activity(busy=0.0):
+	"""Called as a sound starts or changes; resumes a suspended engine before anything reaches it."""
+	monitor=idle
+	if monitor is not None:
+		monitor.touch(busy)
+
+#Set once the backend turns out not to take automation batches the way commit() sends them.
+_automation_failed = False
+
+def commit(context, updates):
+	"""Writes a list of (property, value) pairs so they take effect together.
+	With an automation batch they reach the engine as one command list, applied at the start of the next block; otherwise they are written one by one.
+	A single update is always written directly, since there is nothing for a batch to keep it together with."""
+	global _automation_failed
+	batch_class=getattr(_synthizer_module, "AutomationBatch", None)
+	if len(updates)>1 and batch_class is not None and not _automation_failed:
+		try:
+			batch=batch_class(context)
+#Points at time 0 are already due, so the engine applies them on its next block.
+			for prop, value in updates:
+				batch.append_property(0.0, prop, value)
+			batch.execute()
+			batch.destroy()
+			return
+		except Exception:
+			_automation_failed=True
+			log.debugWarning("Unspoken: automation batches failed, writing properties one by one from now on", exc_info=True)
+	for prop, value in updates:
+		prop.value=value
 
-def initialize_synthizer():
-	global _synthizer_initialized, _synthizer_module, context, reverb
+def initialize_synthizer(backend_name="synthizer", options=None):
+	"""options are passed to the backend's initialize(), for the ones that take any."""
+	global _synthizer_initialized, _synthizer_module, context, reverb, backend
 	if not _synthizer_initialized:
-		from . import synthizer as _synthizer_module
-		_synthizer_module.initialize()
+		_synthizer_module = importlib.import_module("."+backends[backend_name], __package__)
+		backend = backend_name
+		_synthizer_module.initialize(**(options or {}))
 		context = _synthizer_module.Context()
 		reverb = _synthizer_module.GlobalFdnReverb(context)
 		_synthizer_initialized = True
@@ -0,0 +1,249 @@
+#Compiled sound packs for Unspoken.
+#A pack holds sounds already decoded to 32-bit float PCM at the engine sample rate, plus an optional role to sound index.
+#Packs are memory mapped, so loading one only reads a small JSON index; buffers are made straight from the mapped samples.
+#This module doesn't need NVDA, so it doubles as the tool for making packs:
+#	python soundpack.py build <sound directory> <pack file> [sample rate]
+#	python soundpack.py verify <pack file> <sound directory>
+
+import array
+import hashlib
+import json
+import mmap
+import os
+import os.path
+import struct
+import sys
+import wave
+
+#Synthizer renders at 44.1 kHz.
+SAMPLE_RATE = 44100
+PACK_NAME = "sounds.uspk"
+SOURCE_EXTENSIONS = (".wav", ".ogg", ".flac")
+#Optional file in a sound directory mapping role names (as in controlTypes, without ROLE_) to sound files, one "ROLE = file" per line.
+ROLES_FILE = "roles.ini"
+
+_MAGIC = b"USPK"
+_VERSION = 1
+#Magic, version, sample rate, index length.
+_HEADER = struct.Struct("<4sHII")
+#Sample data starts on this boundary, so float views of the map are aligned.
+_ALIGN = 16
+
+class SoundPackError(Exception):
+	pass
+
+def decode_wav(path):
+	"""Decodes a PCM WAV file. Returns (channels, sample rate, interleaved float samples)."""
+	with wave.open(path, "rb") as w:
+		channels = w.getnchannels()
+		width = w.getsampwidth()
+		rate = w.getframerate()
+		frames = w.readframes(w.getnframes())
+	samples = array.array("f")
+	if width == 1:
+		#8-bit WAV is unsigned.
+		samples.extend((b-128)/128.0 for b in frames)
+	elif width == 2:
+		ints = array.array("h", frames)
+		if sys.byteorder == "big":
+			ints.byteswap()
+		samples.extend(i/32768.0 for i in ints)
+	elif width == 3:
+		samples.extend(int.from_bytes(frames[i:i+3], "little", signed=True)/8388608.0 for i in range(0, len(frames), 3))
+	elif width == 4:
+		ints = array.array("i", frames)
+		if sys.byteorder == "big":
+			ints.byteswap()
+		samples.extend(i/2147483648.0 for i in ints)
+	else:
+		raise SoundPackError("%s: unsupported sample width %d"%(path, width))
+	return channels, rate, samples
+
+def decode(path):
+	"""Decodes any supported sound file. Returns (channels, sample rate, interleaved float samples)."""
+	if path.lower().endswith(".wav"):
+		try:
+			return decode_wav(path)
+		except wave.Error:
+			#Not plain PCM (float or compressed WAV); let soundfile have a go.
+			pass
+	try:
+		import soundfile
+	except ImportError:
+		raise SoundPackError("%s: decoding this format needs the soundfile package"%path)
+	data, rate = soundfile.read(path, dtype="float32", always_2d=True)
+	return data.shape[1], rate, array.array("f", data.reshape(-1).tobytes())
+
+def resample(samples, channels, src_rate, dst_rate):
+	"""Linear interpolation resampler. Good enough for short earcons."""
+	if src_rate == dst_rate:
+		return samples
+	src_frames = len(samples)//channels
+	dst_frames = max(1, int(round(src_frames*dst_rate/float(src_rate))))
+	step = src_rate/float(dst_rate)
+	out = array.array("f", bytes(4*dst_frames*channels))
+	for i in range(dst_frames):
+		pos = i*step
+		j = int(pos)
+		frac = pos-j
+		k = min(j+1, src_frames-1)
+		j = min(j, src_frames-1)
+		for c in range(channels):
+			a = samples[j*channels+c]
+			b = samples[k*channels+c]
+			out[i*channels+c] = a+(b-a)*frac
+	return out
+
+def load_source(path, sample_rate=SAMPLE_RATE):
+	"""Decodes path and resamples it to sample_rate. Returns (channels, samples)."""
+	channels, rate, samples = decode(path)
+	return channels, resample(samples, channels, rate, sample_rate)
+
+def read_roles(directory):
+	"""Reads the role index of a sound directory, if it has one."""
+	roles = {}
+	path = os.path.join(directory, ROLES_FILE)
+	if not os.path.isfile(path):
+		return roles
+	with open(path, "r", encoding="utf-8") as f:
+		for line in f:
+			line = line.split("#", 1)[0].strip()
+			if not line:
+				continue
+			role, _, name = line.partition("=")
+			roles[role.strip().upper()] = name.strip()
+	return roles
+
+def write_pack(path, sounds, roles=None, sample_rate=SAMPLE_RATE):
+	"""Writes a pack. sounds maps names to (channels, float samples at sample_rate)."""
+	index = {"sounds" : {}, "roles" : dict(roles or {})}
+	chunks = []
+	offset = 0
+	for name in sorted(sounds):
+		channels, samples = sounds[name]
+		data = array.array("f", samples)
+		if sys.byteorder == "big":
+			data.byteswap()
+		data = data.tobytes()
+		index["sounds"][name] = {
+			"channels" : channels,
+			"offset" : offset,
+			"frames" : len(samples)//channels,
+			#Identical audio gets the same hash, so the add-on can share its buffer.
+			"hash" : hashlib.sha1(data).hexdigest(),
+		}
+		padding = -len(data)%_ALIGN
+		chunks.append(data+bytes(padding))
+		offset += len(data)+padding
+	for role, name in index["roles"].items():
+		if name not in index["sounds"]:
+			raise SoundPackError("role %s uses %s, which is not in the pack"%(role, name))
+	index = json.dumps(index, separators=(",", ":"), sort_keys=True).encode("utf-8")
+	index += b" "*(-(_HEADER.size+len(index))%_ALIGN)
+	with open(path, "wb") as f:
+		f.write(_HEADER.pack(_MAGIC, _VERSION, sample_rate, len(index)))
+		f.write(index)
+		for chunk in chunks:
+			f.write(chunk)
+
+class sound_pack(object):
+	"""A memory mapped pack. Sample views stay valid until close()."""
+
+	def __init__(self, path):
+		self.path = path
+		self._file = open(path, "rb")
+		try:
+			self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+			magic, version, self.sample_rate, index_length = _HEADER.unpack_from(self._map, 0)
+			if magic != _MAGIC or version != _VERSION:
+				raise SoundPackError("%s is not a version %d sound pack"%(path, _VERSION))
+			index = json.loads(bytes(self._map[_HEADER.size:_HEADER.size+index_length]).decode("utf-8"))
+		except:
+			self.close()
+			raise
+		self._data_start = _HEADER.size+index_length
+		self.sounds = index["sounds"]
+		self.roles = index["roles"]
+
+	def __contains__(self, name):
+		return name in self.sounds
+
+	def role_sound(self, role_name):
+		return self.roles.get(role_name)
+
+	def channels(self, name):
+		return self.sounds[name]["channels"]
+
+	def hash(self, name):
+		return self.sounds[name]["hash"]
+
+	def samples(self, name):
+		"""Interleaved float samples of name, as a view into the map."""
+		entry = self.sounds[name]
+		start = self._data_start+entry["offset"]
+		end = start+4*entry["frames"]*entry["channels"]
+		return memoryview(self._map)[start:end].cast("f")
+
+	def close(self):
+		if getattr(self, "_map", None) is not None:
+			self._map.close()
+			self._map = None
+		self._file.close()
+
+def build(directory, path, sample_rate=SAMPLE_RATE):
+	"""Compiles every sound in directory into a pack at path."""
+	sounds = {}
+	for name in sorted(os.listdir(directory)):
+		if name.lower().endswith(SOURCE_EXTENSIONS):
+			sounds[name] = load_source(os.path.join(directory, name), sample_rate)
+	if not sounds:
+		raise SoundPackError("no sounds found in %s"%directory)
+	write_pack(path, sounds, read_roles(directory), sample_rate)
+	return sounds
+
+def verify(path, directory, tolerance=1e-6):
+	"""Checks a pack against decoding its sources again. Returns a list of problems, empty if it matches."""
+	problems = []
+	pack = sound_pack(path)
+	try:
+		for name in sorted(pack.sounds):
+			source = os.path.join(directory, name)
+			if not os.path.isfile(source):
+				problems.append("%s: source file is missing"%name)
+				continue
+			channels, expected = load_source(source, pack.sample_rate)
+			#Released before the next sound even when it doesn't match, so the map can be closed afterwards.
+			with pack.samples(name) as actual:
+				if channels != pack.channels(name) or len(expected) != len(actual):
+					problems.append("%s: expected %d samples in %d channels, pack has %d in %d"%(name, len(expected), channels, len(actual), pack.channels(name)))
+					continue
+				error = max((abs(a-b) for a, b in zip(expected, actual)), default=0.0)
+			if error > tolerance:
+				problems.append("%s: samples differ by up to %g"%(name, error))
+		roles = read_roles(directory)
+		if roles != pack.roles:
+			problems.append("role index differs from %s"%ROLES_FILE)
+	finally:
+		pack.close()
+	return problems
+
+def main(argv):
+	if len(argv) >= 3 and argv[0] == "build":
+		rate = int(argv[3]) if len(argv) > 3 else SAMPLE_RATE
+		sounds = build(argv[1], argv[2], rate)
+		print("Wrote %d sounds to %s"%(len(sounds), argv[2]))
+		problems = verify(argv[2], argv[1])
+	elif len(argv) == 3 and argv[0] == "verify":
+		problems = verify(argv[1], argv[2])
+	else:
+		print("usage: soundpack.py build <directory> <pack> [rate] | verify <pack> <directory>")
+		return 2
+	for problem in problems:
+		print(problem)
+	if problems:
+		return 1
+	print("Pack matches its sources")
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,94 @@
+#Event traces for Unspoken.
+#Records the focus, navigator and mouse events the add-on sees, with each control's role, location and identity and the settings in effect, to a gzipped file of JSON lines.
+#tools/replayTrace.py plays a trace back through the playback path with the null backend, so the hot path can be benchmarked on real load away from Windows.
+#The first line is a header: {"version", "started", "settings"}. Every other line is one event: [milliseconds since start, source, role name, location, window handle, control id, x, y, state names].
+#Control ids are small numbers standing for objcache.object_key identities, so repeats can be told apart without storing runtime IDs.
+
+import collections
+import gzip
+import json
+import threading
+import time
+from logHandler import log
+from . import objcache
+
+FORMAT_VERSION = 1
+#The writer thread wakes this often, in seconds.
+FLUSH_INTERVAL = 0.5
+
+class trace_recorder(object):
+	"""Writes a trace to path. record() only queues the event; the object is read and the line written on the writer thread."""
+
+	def __init__(self, path, snapshot):
+		self.path = path
+		self.file = gzip.open(path, "wt", encoding="utf-8")
+		self.file.write(json.dumps({"version" : FORMAT_VERSION, "started" : time.time(), "settings" : snapshot._asdict()})+"\n")
+		self.started = time.perf_counter()
+		self.pending = collections.deque()
+		self.ids = {}
+		self.events = 0
+		self.running = True
+		self.wake = threading.Event()
+		self.thread = threading.Thread(target=self._run, name="UnspokenTrace", daemon=True)
+		self.thread.start()
+
+	def record(self, source, obj, x=None, y=None):
+		self.pending.append((time.perf_counter()-self.started, source, obj, x, y))
+
+	def _run(self):
+		while self.running:
+			self.wake.wait(FLUSH_INTERVAL)
+			self._flush()
+
+	def _flush(self):
+		lines = []
+		while self.pending:
+			lines.append(json.dumps(self._event(*self.pending.popleft()), separators=(",", ":")))
+		if lines:
+			self.file.write("\n".join(lines)+"\n")
+			self.events += len(lines)
+
+	def _event(self, elapsed, source, obj, x, y):
+		try:
+			role = obj.role
+			location = obj.location
+			hwnd = obj.windowHandle
+			states = obj.states
+			key = objcache.object_key(obj)
+		except:
+			#The control went away before it could be read.
+			role = location = hwnd = states = key = None
+		control = None
+		if key is not None:
+			control = self.ids.setdefault(key, len(self.ids)+1)
+		return [
+			round(elapsed*1000, 2),
+			source,
+			getattr(role, 'name', role),
+			list(location) if location else None,
+			hwnd,
+			control,
+			x,
+			y,
+			sorted(getattr(state, 'name', state) for state in states) if states else [],
+		]
+
+	def close(self):
+		"""Writes what is still queued and closes the file. Returns the number of events written."""
+		self.running = False
+		self.wake.set()
+		self.thread.join(2.0)
+		try:
+			self._flush()
+		finally:
+			self.file.close()
+		log.info("Unspoken: wrote %d events to %s"%(self.events, self.path))
+		return self.events
+
+def read(path):
+	"""Returns (header, events) for the trace at path; events is a list of the event lists."""
+	with gzip.open(path, "rt", encoding="utf-8") as f:
+		header = json.loads(f.readline())
+		if header.get("version") != FORMAT_VERSION:
+			raise ValueError("%s: unsupported trace version %r"%(path, header.get("version")))
+		return header, [json.loads(line) for line in f if line.strip()]
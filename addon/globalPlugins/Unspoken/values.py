@@ -0,0 +1,197 @@
+#Value sonification for Unspoken.
+#Sliders, dials, spin buttons and progress bars play their value as it changes: higher values play higher, and the sound moves along the control to where the value sits.
+#They all share one voice that keeps looping while values keep coming, so dragging a slider bends one sound instead of restarting a sound on every event.
+#Updates go into a single slot that the scheduler writes to the engine at most once per audio block; values that came in between are never sent.
+
+import collections
+import math
+import re
+import threading
+import controlTypes
+from logHandler import log
+from . import sound
+from .geometry import clamp
+
+VALUE_ROLES = frozenset((
+	controlTypes.ROLE_SLIDER,
+	controlTypes.ROLE_DIAL,
+	controlTypes.ROLE_SPINBUTTON,
+	controlTypes.ROLE_PROGRESSBAR,
+))
+
+#Synthizer renders 256 frames at a time, at 44.1 kHz.
+BLOCK_TIME = 256/44100.0
+#The voice fades out once no value has come for this long, in seconds, and the fade takes FADE_TIME.
+HOLD_TIME = 0.15
+FADE_TIME = 0.02
+#Pitch at the bottom and top of the range; the middle plays the sound as it is.
+MIN_PITCH = 0.5
+MAX_PITCH = 2.0
+#Controls whose range is remembered.
+MAX_RANGES = 32
+
+_PERCENT = re.compile(r"(-?\d+(?:[.,]\d+)?)\s*%")
+_OF = re.compile(r"(\d+)\s+(?:of|/)\s+(\d+)")
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+
+def _number(text):
+	return float(text.replace(",", "."))
+
+def pitch(fraction):
+	"""Pitch for a fraction of the range, an octave down to an octave up."""
+	return MIN_PITCH*(MAX_PITCH/MIN_PITCH)**fraction
+
+def point(location, fraction):
+	"""Where on a control's (left, top, width, height) location a fraction of its range sits: left to right along wide controls, bottom to top along tall ones."""
+	if location is None:
+		return None
+	left, top, width, height = location
+	if width >= height:
+		return (left+fraction*width, top+height/2.0, 0, 0)
+	return (left+width/2.0, top+height-fraction*height, 0, 0)
+
+class value_ranges(object):
+	"""Turns a control's value text into a fraction of its range. Only used from the playback thread.
+	Percentages and "3 of 10" positions carry their own range. Plain numbers are taken as 0 to 100 until a control shows values outside that, and the range then grows to take them in."""
+
+	def __init__(self, size=MAX_RANGES):
+		self.size = size
+		self.ranges = collections.OrderedDict()
+
+	def fraction(self, key, text):
+		"""Returns the fraction for text, or None if it has no number in it. key is the control's objcache.object_key."""
+		if not text:
+			return None
+		match = _PERCENT.search(text)
+		if match:
+			return clamp(_number(match.group(1))/100.0, 0.0, 1.0)
+		match = _OF.search(text)
+		if match:
+			position, total = int(match.group(1)), int(match.group(2))
+			if total > 1:
+				return clamp((position-1)/float(total-1), 0.0, 1.0)
+		match = _NUMBER.search(text)
+		if match is None:
+			return None
+		value = _number(match.group())
+		low, high = self.ranges.get(key, (0.0, 100.0))
+		low, high = min(low, value), max(high, value)
+		if key is not None:
+			self.ranges[key] = (low, high)
+			self.ranges.move_to_end(key)
+			while len(self.ranges) > self.size:
+				self.ranges.popitem(last=False)
+		return (value-low)/(high-low)
+
+class value_voice(object):
+	"""The one voice values are played on. update() can be called from any thread and returns at once; the engine is only written from the scheduler thread.
+	loader() returns a loaded sound3d for the voice; it is called when the first value comes, and again after reset()."""
+
+	def __init__(self, loader):
+		self.loader = loader
+		self.voice = None
+		self.lock = threading.RLock()
+		self.pending = None
+		self.flush_handle = None
+		self.idle_handle = None
+		self.fading = None
+		self.playing = False
+		self.last_update = 0.0
+		#Bumped each time the voice starts, so a fade that finishes after a restart leaves it playing.
+		self.generation = 0
+		#Counters, readable from any thread.
+		self.updates = 0
+		self.coalesced = 0
+		self.writes = 0
+
+	def update(self, pitch, position):
+		"""Moves the voice to pitch and position (angles, as sound3d.trigger takes), starting it if it is silent."""
+		with self.lock:
+			self.updates += 1
+			if self.pending is not None:
+				self.coalesced += 1
+			self.pending = (pitch, position)
+			now = sound.scheduler.now()
+			self.last_update = now
+			if self.flush_handle is None:
+				#Due at the next block boundary, so however many updates arrive within a block, one write goes out.
+				self.flush_handle = sound.scheduler.call_at((math.floor(now/BLOCK_TIME)+1)*BLOCK_TIME, self._flush)
+
+	def _flush(self):
+		with self.lock:
+			self.flush_handle = None
+			pending, self.pending = self.pending, None
+			if pending is None:
+				return
+			voice = self._voice()
+			if voice is None:
+				return
+			pitch, position = pending
+			self.writes += 1
+			voice._pitch = pitch
+			if self.playing:
+				#Keeps the engine from being suspended under a long drag.
+				sound.activity(HOLD_TIME)
+				sound.commit(voice.context, [(voice.generator.pitch_bend, pitch), (voice.source.position, position)])
+				voice._position = position
+				return
+			self.generation += 1
+			self.playing = True
+			updates = [(voice.generator.pitch_bend, pitch), (voice.source.position, position)]
+			if self.fading is not None:
+				#Still fading out from the last burst; the fade is cut short and the gain set back along with it.
+				self.fading.cancel()
+				self.fading = None
+				sound.automate(voice.context, voice.source.gain, [(0.0, 1.0)])
+			else:
+				updates.append((voice.source.gain, 1.0))
+			sound.commit(voice.context, updates)
+			voice._position = position
+			voice._gain = 1.0
+			voice.play_looped()
+			self.idle_handle = sound.scheduler.call_at(self.last_update+HOLD_TIME, self._check_idle)
+
+	def _check_idle(self):
+		with self.lock:
+			self.idle_handle = None
+			if not self.playing or self.voice is None:
+				return
+			due = self.last_update+HOLD_TIME
+			if sound.scheduler.now() < due or self.pending is not None:
+				self.idle_handle = sound.scheduler.call_at(due, self._check_idle)
+				return
+			self.playing = False
+			self.fading = sound.automate(self.voice.context, self.voice.source.gain, [(0.0, 1.0), (FADE_TIME, 0.0)])
+			generation = self.generation
+			self.fading.add_done_callback(lambda future: self._faded(future, generation))
+
+	def _faded(self, future, generation):
+		with self.lock:
+			if future.cancelled() or generation != self.generation or self.playing or self.voice is None:
+				return
+			self.fading = None
+			self.voice.stop()
+
+	def _voice(self):
+		if self.voice is None:
+			try:
+				self.voice = self.loader()
+			except:
+				log.debugWarning("Unspoken: could not load the value voice", exc_info=True)
+		return self.voice
+
+	def reset(self):
+		"""Stops and drops the voice; the next value builds it again, picking up a changed audio graph."""
+		with self.lock:
+			sound.scheduler.cancel(self.flush_handle)
+			sound.scheduler.cancel(self.idle_handle)
+			if self.fading is not None:
+				self.fading.cancel()
+			self.flush_handle = self.idle_handle = self.fading = None
+			self.pending = None
+			self.playing = False
+			self.generation += 1
+			voice, self.voice = self.voice, None
+			if voice is not None:
+				voice.stop()
+				voice.close()
@@ -0,0 +1,110 @@
+#State variants for Unspoken.
+#A control's states change its sound: checked boxes play higher, collapsed tree items lower, unavailable controls muffled.
+#Each variant is a pitch, gain and low-pass transform of the role's sound, rendered once into its own buffer, so playing one costs the same as playing the plain sound.
+#variant_table works out every (role, states) combination that matters up front, so the hot path is one set intersection and one dict lookup.
+
+import array
+import collections
+import itertools
+import math
+import controlTypes
+from . import soundpack
+
+#A transform of a sound. lowpass is a cutoff in Hz, or None.
+variant = collections.namedtuple("variant", ("pitch", "gain", "lowpass"))
+PLAIN = variant(1.0, 1.0, None)
+
+#What each state does to a sound. Two semitones up or down for on and off states.
+STATE_VARIANTS = {
+	controlTypes.STATE_CHECKED : variant(1.12, 1.0, None),
+	controlTypes.STATE_HALFCHECKED : variant(1.06, 1.0, None),
+	controlTypes.STATE_PRESSED : variant(1.12, 1.0, None),
+	controlTypes.STATE_EXPANDED : variant(1.12, 1.0, None),
+	controlTypes.STATE_COLLAPSED : variant(0.89, 1.0, None),
+	controlTypes.STATE_UNAVAILABLE : variant(1.0, 0.6, 1500.0),
+}
+
+_CHECKABLE = frozenset((controlTypes.STATE_CHECKED, controlTypes.STATE_HALFCHECKED, controlTypes.STATE_UNAVAILABLE))
+_PRESSABLE = frozenset((controlTypes.STATE_PRESSED, controlTypes.STATE_UNAVAILABLE))
+_EXPANDABLE = frozenset((controlTypes.STATE_EXPANDED, controlTypes.STATE_COLLAPSED, controlTypes.STATE_UNAVAILABLE))
+_OTHER = frozenset((controlTypes.STATE_UNAVAILABLE,))
+
+#States that change each role's sound. Roles not listed only have an unavailable variant.
+ROLE_STATES = {
+	controlTypes.ROLE_CHECKBOX : _CHECKABLE,
+	controlTypes.ROLE_RADIOBUTTON : _CHECKABLE,
+	controlTypes.ROLE_CHECKMENUITEM : _CHECKABLE,
+	controlTypes.ROLE_RADIOMENUITEM : _CHECKABLE,
+	controlTypes.ROLE_TOGGLEBUTTON : _CHECKABLE|_PRESSABLE,
+	controlTypes.ROLE_BUTTON : _PRESSABLE|_EXPANDABLE,
+	controlTypes.ROLE_MENUBUTTON : _EXPANDABLE,
+	controlTypes.ROLE_SPLITBUTTON : _EXPANDABLE,
+	controlTypes.ROLE_DROPDOWNBUTTON : _EXPANDABLE,
+	controlTypes.ROLE_COMBOBOX : _EXPANDABLE,
+	controlTypes.ROLE_TREEVIEWITEM : _EXPANDABLE,
+	controlTypes.ROLE_LISTITEM : _EXPANDABLE,
+	controlTypes.ROLE_MENUITEM : _EXPANDABLE,
+}
+
+def combine(states):
+	"""The variant for a set of states: pitches and gains multiply, and the lowest cutoff wins."""
+	pitch, gain, lowpass = PLAIN
+	for state in states:
+		v = STATE_VARIANTS[state]
+		pitch *= v.pitch
+		gain *= v.gain
+		if v.lowpass is not None:
+			lowpass = v.lowpass if lowpass is None else min(lowpass, v.lowpass)
+	return variant(pitch, gain, lowpass)
+
+def variant_name(base, v):
+	return "%s@p%.3f,g%.2f,l%d"%(base, v.pitch, v.gain, v.lowpass or 0)
+
+class variant_table(object):
+	"""Variants of the sounds in roles, a role to sound name mapping.
+	names maps (role, relevant states) keys to variant sound names, and specs maps those names to (base sound name, variant)."""
+
+	def __init__(self, roles):
+		self.relevant = {}
+		self.names = {}
+		self.specs = {}
+		for role, base in roles.items():
+			states = ROLE_STATES.get(role, _OTHER)
+			self.relevant[role] = states
+			for n in range(1, len(states)+1):
+				for subset in itertools.combinations(states, n):
+					subset = frozenset(subset)
+					v = combine(subset)
+					if v == PLAIN:
+						continue
+					key = (role, subset)
+					name = variant_name(base, v)
+					self.names[key] = name
+					self.specs[name] = (base, v)
+
+	def lookup(self, role, states):
+		"""The key to play role under with states: a variant key, or role itself for the plain sound."""
+		relevant = self.relevant.get(role)
+		if not states or relevant is None:
+			return role
+		key = (role, relevant.intersection(states))
+		return key if key in self.names else role
+
+def render(channels, samples, v, sample_rate=soundpack.SAMPLE_RATE):
+	"""Applies v to interleaved float samples at sample_rate. Returns new samples."""
+	if v.pitch != 1.0:
+		#Played back faster or slower, as pitch_bend would, but worked out once here.
+		samples = soundpack.resample(samples, channels, sample_rate*v.pitch, sample_rate)
+	out = array.array("f", samples)
+	if v.lowpass is not None:
+		#One-pole low-pass, per channel.
+		a = math.exp(-2.0*math.pi*v.lowpass/sample_rate)
+		for c in range(channels):
+			y = 0.0
+			for i in range(c, len(out), channels):
+				y = (1.0-a)*out[i]+a*y
+				out[i] = y
+	if v.gain != 1.0:
+		for i in range(len(out)):
+			out[i] *= v.gain
+	return out
@@ -43,6 +43,19 @@ for dirpath, dirnames, filenames in os.walk(os.path.join("addon", "globalPlugins
 # Files that contain strings for translation. Usually your python sources
 i18nSources = pythonSources + ["buildVars.py", "docHandler.py"]
 
+# Processing applied to the add-on's sounds when bundling; see site_scons/site_tools/audiotool for what each setting does.
+# The files in the sounds folder are left as they are, and the processed copies go into the bundle.
+audio_settings = {
+	"audio_sample_rate" : 44100,
+	"audio_silence_db" : -50.0,
+	"audio_target_rms_db" : -20.0,
+	"audio_peak_db" : -1.0,
+	"audio_preroll_ms" : 1.0,
+	# The build fails if a sound's first audible sample comes later than this.
+	"audio_max_onset_ms" : 5.0,
+	"audio_trim" : True,
+}
+
 # Files that will be ignored when building the nvda-addon file
 # Paths are relative to the addon directory, not to the root directory of your addon sources.
 excludedFiles = []
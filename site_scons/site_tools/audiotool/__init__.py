@@ -0,0 +1,144 @@
+""" This tool prepares the add-on's sounds for shipping.
+
+One new builder is added into the constructed environment:
+
+- processSound: reads a sound file and writes a 16-bit PCM .wav that has its leading and trailing silence trimmed,
+its loudness normalized and its sample rate set to the audio engine's, then reports the onset latency and size before and after.
+The build fails if a sound starts later than audio_max_onset_ms: after processing when it was trimmed, or as it came when audio_trim is off, so a late sound is caught either way.
+
+Decoding and resampling are done with the add-on's own soundpack.py, so no audio packages are needed.
+The following variables control processing, with their defaults:
+
+- audio_sample_rate (44100): the rate sounds are resampled to.
+- audio_silence_db (-50.0): samples quieter than this, in dBFS, count as silence.
+- audio_target_rms_db (-20.0): loudness sounds are normalized to, as RMS in dBFS.
+- audio_peak_db (-1.0): normalization never raises peaks above this, in dBFS.
+- audio_preroll_ms (1.0): time left before the first audible sample, so attacks aren't cut.
+- audio_max_onset_ms (5.0): longest allowed time before the first audible sample of a processed sound.
+- audio_trim (True): whether to trim silence at all.
+- audio_soundpack: path to soundpack.py.
+"""
+import array
+import importlib.util
+import math
+import os
+import sys
+import wave
+from SCons.Action import Action
+
+AUDIO_VARIABLES = ["audio_sample_rate", "audio_silence_db", "audio_target_rms_db", "audio_peak_db", "audio_preroll_ms", "audio_max_onset_ms", "audio_trim"]
+
+_soundpack = None
+
+def _load_soundpack(path):
+	global _soundpack
+	if _soundpack is None:
+		spec = importlib.util.spec_from_file_location("soundpack", path)
+		_soundpack = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(_soundpack)
+	return _soundpack
+
+def _db(db):
+	return 10**(db/20.0)
+
+def audible_range(samples, channels, threshold):
+	"""Returns the first and one past the last frame with a sample at or above threshold, or None for silence."""
+	first = last = None
+	for i, sample in enumerate(samples):
+		if abs(sample) >= threshold:
+			if first is None:
+				first = i//channels
+			last = i//channels
+	if first is None:
+		return None
+	return first, last+1
+
+def normalize(samples, target_rms, peak_limit):
+	"""Scales samples towards target_rms, without taking the peak over peak_limit. Returns the gain used."""
+	if not samples:
+		return 1.0
+	peak = max(abs(s) for s in samples)
+	rms = math.sqrt(sum(s*s for s in samples)/len(samples))
+	if not peak or not rms:
+		return 1.0
+	gain = min(target_rms/rms, peak_limit/peak)
+	for i in range(len(samples)):
+		samples[i] *= gain
+	return gain
+
+def write_wav(path, channels, rate, samples):
+	ints = array.array("h", (max(-32768, min(32767, int(round(s*32767.0)))) for s in samples))
+	if sys.byteorder == "big":
+		ints.byteswap()
+	with wave.open(path, "wb") as w:
+		w.setnchannels(channels)
+		w.setsampwidth(2)
+		w.setframerate(rate)
+		w.writeframes(ints.tobytes())
+
+def process(source, target, env):
+	"""Processes one sound. Returns a report line, or raises ValueError if its onset is too late."""
+	soundpack = _load_soundpack(env["audio_soundpack"])
+	rate = env["audio_sample_rate"]
+	threshold = _db(env["audio_silence_db"])
+	channels, source_rate, samples = soundpack.decode(source)
+	found = audible_range(samples, channels, threshold)
+	onset_before = found[0]*1000.0/source_rate if found else 0.0
+	samples = soundpack.resample(samples, channels, source_rate, rate)
+	samples = array.array("f", samples)
+	found = audible_range(samples, channels, threshold)
+	trimmed = bool(env["audio_trim"] and found)
+	if trimmed:
+		preroll = int(env["audio_preroll_ms"]*rate/1000.0)
+		start = max(0, found[0]-preroll)
+		end = found[1]
+		samples = samples[start*channels:end*channels]
+		#A couple of milliseconds of fade, so the cut at the end doesn't click.
+		fade = min(len(samples)//channels, int(0.002*rate))
+		for i in range(fade):
+			for c in range(channels):
+				samples[(len(samples)//channels-fade+i)*channels+c] *= 1.0-float(i+1)/fade
+	gain = normalize(samples, _db(env["audio_target_rms_db"]), _db(env["audio_peak_db"]))
+	write_wav(target, channels, rate, samples)
+	found = audible_range(samples, channels, threshold)
+	onset_after = found[0]*1000.0/rate if found else 0.0
+	report = "%s: onset %.1f -> %.1f ms, %d -> %d bytes, %d -> %d Hz, gain %+.1f dB"%(
+		os.path.basename(source),
+		onset_before, onset_after,
+		os.path.getsize(source), os.path.getsize(target),
+		source_rate, rate,
+		20*math.log10(gain) if gain > 0 else 0.0,
+	)
+	#Trimming only leaves the preroll in front, so an untrimmed sound is judged by the lead-in it came with.
+	onset = onset_after if trimmed else onset_before
+	if onset > env["audio_max_onset_ms"]:
+		raise ValueError("%s; first audible sample is later than %.1f ms%s"%(report, env["audio_max_onset_ms"], "" if trimmed else " and audio_trim is off"))
+	return report
+
+def _process_action(target, source, env):
+	try:
+		print(process(source[0].abspath, target[0].abspath, env))
+	except ValueError as e:
+		print("error: %s"%e)
+		if os.path.exists(target[0].abspath):
+			os.remove(target[0].abspath)
+		return 1
+	return 0
+
+def exists(env):
+	return True
+
+def generate(env):
+	env.SetDefault(audio_sample_rate=44100)
+	env.SetDefault(audio_silence_db=-50.0)
+	env.SetDefault(audio_target_rms_db=-20.0)
+	env.SetDefault(audio_peak_db=-1.0)
+	env.SetDefault(audio_preroll_ms=1.0)
+	env.SetDefault(audio_max_onset_ms=5.0)
+	env.SetDefault(audio_trim=True)
+	env.SetDefault(audio_soundpack=os.path.join("addon", "globalPlugins", "Unspoken", "soundpack.py"))
+
+	env['BUILDERS']['processSound']=env.Builder(
+		action=Action(_process_action, "Processing sound $SOURCE", varlist=AUDIO_VARIABLES),
+		suffix=".wav",
+	)
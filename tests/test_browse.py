@@ -0,0 +1,196 @@
+#Tests for the browse mode index: a control spliced in with update() has to leave the index as a full scan of the changed document would.
+#The virtual buffer is stood in for by a tree of text and control fields, so these run without NVDA.
+
+import importlib.util
+import logging
+import os
+import sys
+import types
+
+import pytest
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "addon", "globalPlugins", "Unspoken")
+
+class _FieldCommand(object):
+	def __init__(self, command, field):
+		self.command = command
+		self.field = field
+
+class _Offsets(object):
+	def __init__(self, startOffset, endOffset):
+		self.startOffset = startOffset
+		self.endOffset = endOffset
+
+def _load_browse():
+	log = logging.getLogger("Unspoken")
+	log.debugWarning = log.debug
+	logHandler = types.ModuleType("logHandler")
+	logHandler.log = log
+	textInfos = types.ModuleType("textInfos")
+	textInfos.POSITION_ALL = "all"
+	textInfos.FieldCommand = _FieldCommand
+	textInfos.offsets = types.ModuleType("textInfos.offsets")
+	textInfos.offsets.Offsets = _Offsets
+	for module in (logHandler, textInfos, textInfos.offsets):
+		sys.modules.setdefault(module.__name__, module)
+	spec = importlib.util.spec_from_file_location("unspoken_browse", os.path.join(ADDON_PATH, "browse.py"))
+	browse = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(browse)
+	return browse
+
+browse = _load_browse()
+
+ROLES = frozenset(("link", "button", "checkbox"))
+
+def text(value):
+	return ["text", value]
+
+def field(ID, role, *children, states=None):
+	return ["field", ID, role, states, list(children)]
+
+class fake_document(object):
+	"""A virtual buffer made of nested text and fields. Offsets are worked out afresh from the tree each time, as the buffer would."""
+
+	def __init__(self, *children):
+		self.root = list(children)
+
+	def _extents(self):
+		extents = {}
+		def walk(nodes, offset):
+			for node in nodes:
+				if node[0] == "text":
+					offset += browse._length(node[1])
+				else:
+					start = offset
+					offset = walk(node[4], offset)
+					extents[node[1]] = (start, offset)
+			return offset
+		return extents, walk(self.root, 0)
+
+	def find(self, ID):
+		def walk(nodes):
+			for node in nodes:
+				if node[0] == "field":
+					if node[1] == ID:
+						return node
+					found = walk(node[4])
+					if found is not None:
+						return found
+			return None
+		return walk(self.root)
+
+	def _getOffsetsFromFieldIdentifier(self, docHandle, ID):
+		extents, length = self._extents()
+		if ID not in extents:
+			raise LookupError(ID)
+		return extents[ID]
+
+	def makeTextInfo(self, position):
+		extents, length = self._extents()
+		if position == "all":
+			return fake_info(self, 0, length)
+		return fake_info(self, position.startOffset, position.endOffset)
+
+class fake_info(object):
+
+	def __init__(self, document, start, end):
+		self.document = document
+		self._startOffset = start
+		self._endOffset = end
+
+	def getTextWithFields(self):
+		"""Text and fields in the range, with the fields open at its start given first, as a virtual buffer does."""
+		start, end = self._startOffset, self._endOffset
+		extents, length = self.document._extents()
+		items = []
+		def walk(nodes, offset):
+			for node in nodes:
+				if node[0] == "text":
+					size = browse._length(node[1])
+					if offset < end and offset+size > start:
+						items.append(node[1][max(0, start-offset):end-offset])
+					offset += size
+					continue
+				ID, role, states, children = node[1:]
+				fieldStart, fieldEnd = extents[ID]
+				inside = fieldStart < end and fieldEnd > start
+				if inside:
+					items.append(_FieldCommand("controlStart", {"controlIdentifier_docHandle" : 1, "controlIdentifier_ID" : ID, "role" : role, "states" : states}))
+				offset = walk(children, offset)
+				if inside and fieldEnd <= end:
+					items.append(_FieldCommand("controlEnd", None))
+			return offset
+		walk(self.document.root, 0)
+		return items
+
+def _document():
+	return fake_document(
+		text("Intro "),
+		field(1, "heading",
+			text("Title "),
+			field(2, "link", text("home")),
+		),
+		text(" between "),
+		field(3, "list",
+			field(4, "button", text("ok"), field(5, "checkbox", text("x"), states={"checked"})),
+			text(" and "),
+			field(6, "link", text("more")),
+		),
+		text(" end"),
+	)
+
+def _assert_same(index, document):
+	fresh = browse.document_index(document, ROLES)
+	assert index.starts == fresh.starts
+	assert index.entries == fresh.entries
+	assert {key : tuple(value) for key, value in index.fields.items()} == {key : tuple(value) for key, value in fresh.fields.items()}
+
+def _set_text(node, value):
+	node[4][0][1] = value
+
+@pytest.mark.parametrize("ID, change", [
+	(2, lambda node: _set_text(node, "home page")),
+	(2, lambda node: _set_text(node, "h")),
+	(4, lambda node: _set_text(node, "cancel")),
+	(5, lambda node: node.__setitem__(3, frozenset(("checked", "focused")))),
+	(4, lambda node: node[4].pop()),
+	(4, lambda node: node[4].append(field(7, "link", text("new")))),
+	(3, lambda node: node[4].insert(0, text("Items: "))),
+	(6, lambda node: _set_text(node, "\U0001f600 more")),
+])
+def test_update_matches_full_scan(ID, change):
+	document = _document()
+	index = browse.document_index(document, ROLES)
+	change(document.find(ID))
+	assert index.update(document, (1, ID))
+	_assert_same(index, document)
+
+def test_repeated_updates_match_full_scan():
+	document = _document()
+	index = browse.document_index(document, ROLES)
+	for ID, value in ((2, "start"), (6, "less"), (2, "s"), (4, "apply now")):
+		_set_text(document.find(ID), value)
+		assert index.update(document, (1, ID))
+	_assert_same(index, document)
+
+def test_verify_marks_index_stale_when_document_moved():
+	document = _document()
+	index = browse.document_index(document, ROLES)
+	start, end = index.fields[(1, 6)]
+	assert index.verify((1, 6), start)
+	#Changed without an event: the link is now further on than the index has it.
+	document.root[0][1] = "A longer intro "
+	assert not index.verify((1, 6), start)
+	assert index.stale
+
+def test_stale_index_is_served_until_rebuilt():
+	document = _document()
+	indexes = browse.document_indexes(ROLES)
+	indexes.build(document)
+	old = indexes.get(document)
+	#Controls came or went: the old index keeps answering until the new one is in.
+	indexes.changed(document, None)
+	assert indexes.get(document) is old and old.stale
+	indexes.build(document)
+	new = indexes.get(document)
+	assert new is not old and not new.stale
@@ -0,0 +1,275 @@
+#Replays an Unspoken event trace through the add-on's playback path, without NVDA or an audio device.
+#NVDA's modules are replaced with small stand-ins and the null audio backend is used, so this runs on any platform with Python 3.
+#Events go through the same playback queue, event filter, object cache and GlobalPlugin.play_object as in NVDA, at the recorded pace or faster.
+#Mouse moves go through GlobalPlugin.event_mouseMove, so the hit tester indexes each window from the controls the trace saw in it.
+#Reports throughput, the latency of each stage, how many events were coalesced, dropped or filtered, and how many engine calls were made.
+#Traces are recorded in NVDA with the "record an Unspoken event trace" command, or made up here with --generate for typical load shapes.
+#Usage:
+#python tools/replayTrace.py trace.jsonl.gz [--speed N]
+#python tools/replayTrace.py --generate sweep|scroll out.jsonl.gz
+
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+import types
+
+ADDON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "addon", "globalPlugins")
+
+class _anything(object):
+	"""Stands in for any NVDA or wx object the add-on touches but the replay doesn't care about."""
+
+	def __init__(self, *args, **kwargs):
+		pass
+
+	def __getattr__(self, name):
+		return _anything()
+
+	def __call__(self, *args, **kwargs):
+		return _anything()
+
+class _action(object):
+	def __init__(self):
+		self.handlers = []
+
+	def register(self, handler):
+		self.handlers.append(handler)
+
+	def unregister(self, handler):
+		if handler in self.handlers:
+			self.handlers.remove(handler)
+
+	def notify(self, **kwargs):
+		for handler in list(self.handlers):
+			handler(**kwargs)
+
+class _role(object):
+	"""A control role or state, known by its NVDA name."""
+	_roles = {}
+
+	def __init__(self, name):
+		self.name = name
+
+	def __repr__(self):
+		return "Role.%s"%self.name
+
+	@classmethod
+	def named(cls, name):
+		role = cls._roles.get(name)
+		if role is None:
+			role = cls._roles[name] = cls(name)
+		return role
+
+class _config(dict):
+	spec = {}
+
+class _display(object):
+	"""One 1920 by 1080 screen."""
+
+	@staticmethod
+	def GetCount():
+		return 1
+
+	def __init__(self, index):
+		pass
+
+	def GetGeometry(self):
+		return types.SimpleNamespace(x=0, y=0, width=1920, height=1080)
+
+	def IsPrimary(self):
+		return True
+
+def _module(name, **attributes):
+	module = types.ModuleType(name)
+	module.__dict__.update(attributes)
+	sys.modules[name] = module
+	return module
+
+#Root objects of the windows in the trace by handle, and the window of the latest event, for the object lookups stubbed below.
+_windows = {}
+_foreground = [None]
+
+def install_stubs():
+	"""Puts stand-ins for the NVDA modules the add-on imports into sys.modules."""
+	import logging
+	log = logging.getLogger("Unspoken")
+	log.debugWarning = log.debug
+	controlTypes = _module("controlTypes", OutputReason=types.SimpleNamespace(QUERY="query"))
+	#Role and state constants are made when first asked for, so the add-on's tables work whatever they name.
+	controlTypes.__getattr__ = lambda name: _role.named(name.partition("_")[2]) if name.startswith(("ROLE_", "STATE_")) else _anything()
+	_module("logHandler", log=log)
+	_module("extensionPoints", Action=_action)
+	_module("config", conf=_config(), post_configSave=_action(), post_configReset=_action(), post_configProfileSwitch=_action())
+	_module("globalPluginHandler", GlobalPlugin=object)
+	NVDAObjects = _module("NVDAObjects", controlTypes=controlTypes, api=_anything())
+	NVDAObjects.IAccessible = _module("NVDAObjects.IAccessible", getNVDAObjectFromEvent=lambda hwnd, objectID, childID: _windows.get(hwnd))
+	synth = types.SimpleNamespace(volume=100)
+	speech = _module("speech", speech=types.SimpleNamespace(getPropertiesSpeech=lambda *args, **kwargs: [], getSynth=lambda: synth))
+	speech.sayAll = _module("speech.sayAll", SayAllHandler=types.SimpleNamespace(isRunning=lambda: False))
+	settingsDialogs = types.SimpleNamespace(SettingsPanel=object, NVDASettingsDialog=types.SimpleNamespace(categoryClasses=[]))
+	_module("gui", settingsDialogs=settingsDialogs, guiHelper=_anything(), NVDASettingsDialog=settingsDialogs.NVDASettingsDialog, mainFrame=_anything(), messageBox=_anything())
+	_module("api", setNavigatorObject=lambda obj, *args, **kwargs: True, getNavigatorObject=lambda: None, getForegroundObject=lambda: _foreground[0], getDesktopObject=lambda: None)
+	_module("inputCore", decide_executeGesture=_action())
+	_module("queueHandler", eventQueue=None, queueFunction=lambda queue, function, *args, **kwargs: function(*args, **kwargs))
+	_module("synthDriverHandler", synthChanged=_action(), SynthDriver=type("SynthDriver", (object,), {"saveSettings" : lambda self: None}))
+	_module("ui", message=lambda text: None)
+	_module("winUser", GA_ROOT=2, OBJID_CLIENT=-4, getAncestor=lambda hwnd, flags: hwnd)
+	_module("globalVars", appArgs=types.SimpleNamespace(configPath="."))
+	_module("scriptHandler", script=lambda **kwargs: (lambda function: function))
+	textInfos = _module("textInfos", POSITION_ALL="all", FieldCommand=type("FieldCommand", (object,), {}))
+	textInfos.offsets = _module("textInfos.offsets", Offsets=_anything)
+	_module("review", handleCaretMove=lambda pos, *args, **kwargs: None)
+	_module("virtualBuffers", VirtualBuffer=type("VirtualBuffer", (object,), {}))
+	_module("wx", Timer=_anything, EVT_TIMER=None, EVT_DISPLAY_CHANGED=None, CallAfter=lambda function, *args: None, Display=_display, CheckBox=_anything, StaticText=_anything, Slider=_anything)
+	sys.path.insert(0, ADDON_PATH)
+
+def _default(value):
+	match = re.search(r"default=('[^']*'|[^,)]*)", value)
+	text = match.group(1)
+	if value.startswith("boolean"):
+		return text == "True"
+	if value.startswith("integer"):
+		return int(text)
+	if value.startswith("float"):
+		return float(text)
+	return text.strip("'")
+
+def load_plugin(trace_settings):
+	"""Imports the add-on with the given settings over the defaults, the null backend forced, and returns a GlobalPlugin."""
+	import config
+	from Unspoken import settings
+	section = {key : _default(value) for key, value in settings.spec.items()}
+	section.update((key, value) for key, value in trace_settings.items() if key in section)
+	section["backend"] = "null"
+	section["metrics"] = True
+	config.conf["unspoken"] = section
+	import Unspoken
+	plugin = Unspoken.GlobalPlugin()
+	plugin._startup_thread.join()
+	return plugin
+
+class trace_object(object):
+	"""A control from a trace, with just what the add-on reads."""
+
+	def __init__(self, role, location, hwnd, control, states=()):
+		self.role = _role.named(role) if role else None
+		self.states = set(_role.named(state) for state in states)
+		self.location = tuple(location) if location else None
+		self.windowHandle = hwnd
+		#A control id becomes an IAccessible2 unique ID, so objcache.object_key gives repeats of the control the same key.
+		self.IAccessibleObject = True if control else None
+		self.IA2UniqueID = control
+		self.children = []
+
+def trace_windows(events):
+	"""Makes a root object for each window in events, with every control seen in it as a child and bounds taking them all in."""
+	windows = {}
+	seen = set()
+	for event in events:
+		role, location, hwnd, control = event[2:6]
+		if not location or (hwnd, control) in seen:
+			continue
+		seen.add((hwnd, control))
+		root = windows.get(hwnd)
+		if root is None:
+			root = windows[hwnd] = trace_object(None, location, hwnd, None)
+		left, top, width, height = root.location
+		right, bottom = max(left+width, location[0]+location[2]), max(top+height, location[1]+location[3])
+		left, top = min(left, location[0]), min(top, location[1])
+		root.location = (left, top, right-left, bottom-top)
+		root.children.append(trace_object(role, location, hwnd, control, event[8] if len(event) > 8 else ()))
+	return windows
+
+def replay(plugin, events, speed):
+	"""Feeds events to the add-on, speed times as fast as recorded (0 for no waiting). Returns the wall time taken."""
+	_windows.clear()
+	_windows.update(trace_windows(events))
+	started = time.perf_counter()
+	for event in events:
+		elapsed, source, role, location, hwnd, control, x, y = event[:8]
+		if speed:
+			delay = started+elapsed/1000.0/speed-time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+		obj = trace_object(role, location, hwnd, control, event[8] if len(event) > 8 else ())
+		_foreground[0] = _windows.get(hwnd)
+		if source == "mouse":
+			plugin.event_mouseMove(obj, lambda: None, x, y)
+		else:
+			plugin._playback.submit(source, obj)
+	#Let the queues drain.
+	while plugin._playback.stats()["pending"] or plugin._indexer.stats()["pending"]:
+		time.sleep(0.001)
+	time.sleep(0.01)
+	return time.perf_counter()-started
+
+def report(plugin, events, wall):
+	from Unspoken import metrics, sound
+	stats = plugin._playback.stats()
+	calls = sound._synthizer_module.recorder
+	print("%d events replayed in %.3f s, %.0f events/s"%(len(events), wall, len(events)/wall if wall else 0.0))
+	print("queue: %d queued, %d coalesced, %d dropped, %d handled, %d failed"%(stats["queued"], stats["coalesced"], stats["dropped"], stats["handled"], stats["failed"]))
+	print("filter: %d repeats dropped, %d rate limited"%(plugin._event_filter.deduplicated, plugin._event_filter.limited))
+	print("object cache: %d hits, %d misses"%(plugin._object_cache.hits, plugin._object_cache.misses))
+	for line in metrics.report():
+		print(line)
+	played = sum(n for name, n in metrics._counters.items() if name.startswith("played/") and name[7:] in ("focus", "mouse", "navigator"))
+	print("engine calls: %d, %.1f per sound played"%(calls.total, calls.total/float(played) if played else 0.0))
+	for op, n in sorted(calls.counts.items()):
+		print("  %s: %d"%(op, n))
+
+def generate(shape, path):
+	"""Writes a made-up trace: a mouse sweep across a grid of buttons, or fast arrowing through a list."""
+	events = []
+	if shape == "sweep":
+		#Ten passes of the pointer over a row of 20 buttons, one move every 8 ms.
+		t = 0.0
+		for sweep in range(10):
+			for x in range(0, 1600, 4):
+				button = x//80
+				events.append([round(t, 2), "mouse", "BUTTON", [button*80, 500, 80, 30], 1001, button+1, x, 510, ["UNAVAILABLE"] if button%5 == 4 else []])
+				t += 8.0
+	elif shape == "scroll":
+		#Holding an arrow key in a 500 item list: focus every 30 ms, each followed by the navigator.
+		t = 0.0
+		for item in range(500):
+			location = [100, 100+(item%25)*20, 400, 20]
+			states = ["COLLAPSED"] if item%10 == 0 else []
+			events.append([round(t, 2), "focus", "LISTITEM", location, 1002, item+1, None, None, states])
+			events.append([round(t+0.5, 2), "navigator", "LISTITEM", location, 1002, item+1, None, None, states])
+			t += 30.0
+	else:
+		raise ValueError("unknown shape %r"%shape)
+	with gzip.open(path, "wt", encoding="utf-8") as f:
+		f.write(json.dumps({"version" : 1, "started" : time.time(), "settings" : {}})+"\n")
+		for event in events:
+			f.write(json.dumps(event, separators=(",", ":"))+"\n")
+	print("wrote %d events to %s"%(len(events), path))
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description="Replays an Unspoken event trace with the null audio backend")
+	parser.add_argument("trace")
+	parser.add_argument("--speed", type=float, default=1.0, help="replay speed; 0 replays as fast as possible")
+	parser.add_argument("--generate", choices=("sweep", "scroll"), help="write a made-up trace of this shape to TRACE instead of replaying")
+	args = parser.parse_args(argv)
+	if args.generate:
+		generate(args.generate, args.trace)
+		return 0
+	install_stubs()
+	from Unspoken import trace
+	header, events = trace.read(args.trace)
+	plugin = load_plugin(header.get("settings", {}))
+	from Unspoken import metrics, sound
+	#Startup isn't part of the measurement.
+	metrics.reset()
+	sound._synthizer_module.recorder.clear()
+	wall = replay(plugin, events, args.speed)
+	report(plugin, events, wall)
+	plugin.terminate()
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())